@@ -0,0 +1,282 @@
+"""
+Local batch equivalent of landcover_mask.js.
+
+Applies the ESA WorldCover class mask (20: Shrubland, 30: Grassland,
+60: Bare/Sparse Vegetation) and polygon clipping to the yearly
+Landsat/NDFI rasters, writing one GeoTIFF per polygon and year named like
+the Earth Engine exports (NDFI_Masked_[YEAR]_[AREA].tif).
+
+Instead of one export per polygon and year, all years and polygons are
+processed in a single pass over shared block-aligned windows: for every
+window the WorldCover mask and the polygon masks are computed once and
+applied to every year. Windows are processed on a process pool and
+written by the main process, so memory stays bounded by the window size.
+
+The yearly rasters must share the same grid. The WorldCover raster is
+resampled on the fly (nearest neighbour) to that grid, and the polygons
+are reprojected to it.
+
+Usage:
+    python landcover_mask.py mask_5_8.geojson worldcover.tif output_dir \\
+        --image 2013=bbox-wirong-Landsat-2013.tif --image 2015=bbox-wirong-Landsat-2015.tif
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fiona
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.features import bounds as geometry_bounds, geometry_mask
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds, transform as window_transform
+
+# raster_stack.py sits next to this script, which is not part of a package;
+# make it importable when the module is loaded from elsewhere
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+
+from raster_stack import DEFAULT_MAX_PIXELS, block_windows  # noqa: E402
+
+# WorldCover classes kept by the mask
+LANDCOVER_CLASSES = (20, 30, 60)
+
+# Datasets opened once per worker process
+_state = {}
+
+
+def read_polygons(path, crs, id_field='Area'):
+    """
+    Returns (area, geometry) tuples for the polygons of a vector file,
+    with the geometries reprojected to crs.
+    """
+    with fiona.open(path) as src:
+        return [
+            (feature['properties'][id_field], transform_geom(src.crs, crs, feature['geometry']))
+            for feature in src
+        ]
+
+
+def _grid(images):
+    """
+    Returns the profile shared by the yearly rasters.
+    """
+    profile = None
+    for year, path in images.items():
+        with rasterio.open(path) as src:
+            grid = (src.crs, src.transform, src.width, src.height)
+            if profile is None:
+                profile, reference = src.profile.copy(), grid
+            elif grid != reference:
+                raise ValueError('The raster for {} is not on the same grid as the others'.format(year))
+    return profile
+
+
+def _polygon_window(geometry, profile):
+    """
+    Returns the grid window covering a polygon, or None when the polygon
+    lies outside the grid.
+    """
+    full = Window(0, 0, profile['width'], profile['height'])
+    window = from_bounds(*geometry_bounds(geometry), transform=profile['transform'])
+    window = window.round_offsets(op='floor').round_lengths(op='ceil')
+    try:
+        return window.intersection(full)
+    except WindowError:
+        return None
+
+
+def _init_worker(landcover_path, images, polygons, profile, classes):
+    landcover = rasterio.open(landcover_path)
+    _state['landcover'] = WarpedVRT(
+        landcover,
+        crs=profile['crs'],
+        transform=profile['transform'],
+        width=profile['width'],
+        height=profile['height'],
+        resampling=Resampling.nearest
+    )
+    _state['images'] = {year: rasterio.open(path) for year, path in images.items()}
+    _state['polygons'] = polygons
+    _state['classes'] = classes
+
+
+def _process_window(task):
+    """
+    Masks one window for every year and every polygon overlapping it.
+    Returns (polygon index, year, window, data, keep) tuples, where keep is
+    the boolean array of pixels inside the polygon with a kept landcover
+    class. Polygons without any kept pixel in the window are left out.
+    """
+    (col_off, row_off, width, height), polygon_indices = task
+    window = Window(col_off, row_off, width, height)
+    transform = window_transform(window, _state['landcover'].transform)
+
+    landcover = _state['landcover'].read(1, window=window)
+    keep = np.isin(landcover, _state['classes'])
+    if not keep.any():
+        keep_by_polygon = {}
+    else:
+        keep_by_polygon = {
+            index: keep & geometry_mask(
+                [_state['polygons'][index][1]], out_shape=keep.shape, transform=transform, invert=True)
+            for index in polygon_indices
+        }
+
+    results = []
+    for year, src in _state['images'].items():
+        data = None
+        for index in polygon_indices:
+            polygon_keep = keep_by_polygon.get(index)
+            if polygon_keep is None or not polygon_keep.any():
+                continue
+            if data is None:
+                # Each year is read once per window, whatever the number of polygons
+                data = src.read(window=window)
+            results.append((index, year, window, data, polygon_keep))
+    return results
+
+
+def mask_landcover(landcover_path, images, polygons, output_dir,
+                   classes=LANDCOVER_CLASSES, max_pixels=DEFAULT_MAX_PIXELS,
+                   max_workers=None, nodata=None):
+    """
+    Writes the landcover-masked, polygon-clipped raster of every polygon
+    and year to output_dir and returns their paths.
+
+    images maps years to raster paths on a shared grid; polygons is a list
+    of (area, geometry) tuples in the grid CRS. Masked pixels are set to
+    nodata, which defaults to the rasters' own nodata, else NaN for
+    floating point data and 0 otherwise.
+    """
+    images = {str(year): str(path) for year, path in images.items()}
+    profile = _grid(images)
+    if nodata is None:
+        nodata = profile.get('nodata')
+    if nodata is None:
+        nodata = np.nan if np.issubdtype(np.dtype(profile['dtype']), np.floating) else 0
+
+    polygon_windows = [_polygon_window(geometry, profile) for _, geometry in polygons]
+
+    # Open one output per polygon and year, covering the polygon's window
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    outputs = {}
+    for index, (area, _) in enumerate(polygons):
+        polygon_window = polygon_windows[index]
+        if polygon_window is None:
+            continue
+        out_profile = profile.copy()
+        out_profile.update(
+            width=polygon_window.width,
+            height=polygon_window.height,
+            transform=window_transform(polygon_window, profile['transform']),
+            nodata=nodata,
+            tiled=True,
+            compress='deflate'
+        )
+        # Let GDAL pick tile sizes, the source may be striped
+        out_profile.pop('blockxsize', None)
+        out_profile.pop('blockysize', None)
+        for year in images:
+            path = os.path.join(output_dir, 'NDFI_Masked_{}_{}.tif'.format(year, area))
+            # Blocks that are never written are filled with nodata by GDAL
+            outputs[(index, year)] = rasterio.open(path, 'w', **out_profile)
+
+    # Shared windows, each tagged with the polygons overlapping it
+    with rasterio.open(next(iter(images.values()))) as src:
+        windows = list(block_windows(src, max_pixels))
+    tasks = []
+    for window in windows:
+        overlapping = [
+            index for index, polygon_window in enumerate(polygon_windows)
+            if polygon_window is not None and _intersects(window, polygon_window)
+        ]
+        if overlapping:
+            tasks.append(((window.col_off, window.row_off, window.width, window.height), overlapping))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(landcover_path, images, polygons, profile, tuple(classes))
+        ) as executor:
+            for results in _bounded_map(executor, _process_window, tasks, 2 * max_workers):
+                for index, year, window, data, polygon_keep in results:
+                    _write_masked(outputs[(index, year)], polygon_windows[index],
+                                  window, data, polygon_keep, nodata)
+    finally:
+        for dst in outputs.values():
+            dst.close()
+
+    return [dst.name for dst in outputs.values()]
+
+
+def _bounded_map(executor, function, tasks, max_pending):
+    """
+    Like executor.map, in order, but with at most max_pending tasks in
+    flight so finished windows never pile up in memory.
+    """
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _intersects(window, other):
+    return (window.col_off < other.col_off + other.width and other.col_off < window.col_off + window.width
+            and window.row_off < other.row_off + other.height and other.row_off < window.row_off + window.height)
+
+
+def _write_masked(dst, polygon_window, window, data, polygon_keep, nodata):
+    """
+    Writes the kept pixels of a grid window into a polygon output.
+    """
+    overlap = window.intersection(polygon_window)
+    rows = slice(int(overlap.row_off - window.row_off), int(overlap.row_off - window.row_off + overlap.height))
+    cols = slice(int(overlap.col_off - window.col_off), int(overlap.col_off - window.col_off + overlap.width))
+    masked = np.where(polygon_keep[rows, cols], data[:, rows, cols], nodata).astype(data.dtype)
+    dst.write(masked, window=Window(
+        overlap.col_off - polygon_window.col_off,
+        overlap.row_off - polygon_window.row_off,
+        overlap.width,
+        overlap.height
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mask yearly rasters by WorldCover classes and clip them to polygons.')
+    parser.add_argument('polygons', help='Polygon vector file (e.g. the mask_5_8 polygons)')
+    parser.add_argument('landcover', help='ESA WorldCover raster covering the polygons')
+    parser.add_argument('output_dir', help='Directory for the masked rasters')
+    parser.add_argument('--image', action='append', required=True, metavar='YEAR=PATH',
+                        help='Yearly raster, repeat for every year')
+    parser.add_argument('--id-field', default='Area', help='Polygon field used in the output names')
+    parser.add_argument('--classes', nargs='+', type=int, default=list(LANDCOVER_CLASSES),
+                        help='WorldCover classes to keep (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    images = dict(image.split('=', 1) for image in args.image)
+    with rasterio.open(next(iter(images.values()))) as src:
+        crs = src.crs
+    polygons = read_polygons(args.polygons, crs, args.id_field)
+
+    for path in mask_landcover(args.landcover, images, polygons, args.output_dir,
+                               classes=args.classes, max_workers=args.workers):
+        print(f"Written: {Path(path).name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Tools for the multi-year NDFI GeoTIFF stacks (one band per year).
+
+- Band descriptions are updated in place: the files are opened in 'r+'
+  mode and only their metadata is rewritten, the pixels are untouched.
+- Files are processed concurrently in a thread pool; rasterio releases
+  the GIL while GDAL does the I/O.
+- Pixel operations run on block-aligned windows, so memory stays bounded
+  by the window size whatever the size of the stack.
+
+Usage:
+    python raster_stack.py "G:/My Drive/NDFI_Combined"
+    python raster_stack.py "G:/My Drive/NDFI_Combined" --names 2013 2015 2017 --workers 8
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import rasterio
+from rasterio.windows import Window
+
+# Band names of the 2013-2023 NDFI stacks
+DEFAULT_BAND_NAMES = ['2013', '2015', '2017', '2019', '2021', '2023']
+
+# Pixels per band read at once by the windowed operations
+DEFAULT_MAX_PIXELS = 4 * 1024 * 1024
+
+
+def set_band_descriptions(path, band_names):
+    """
+    Sets the band descriptions of a GeoTIFF in place, without reading or
+    rewriting its pixels.
+    """
+    with rasterio.open(path, 'r+') as dst:
+        if dst.count != len(band_names):
+            raise ValueError('{} has {} bands but {} names were given'.format(
+                Path(path).name, dst.count, len(band_names)))
+        for index, band_name in enumerate(band_names, start=1):
+            dst.set_band_description(index, band_name)
+    return path
+
+
+def rename_bands(paths, band_names=DEFAULT_BAND_NAMES, max_workers=None):
+    """
+    Sets the band descriptions of many GeoTIFFs concurrently. Yields a
+    (path, error) tuple per file as it completes, error being None on
+    success.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(set_band_descriptions, path, band_names): path for path in paths}
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
+
+
+def block_windows(src, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Yields windows aligned to the internal blocks of a raster.
+
+    Whole rows of blocks are grouped into strips of at most max_pixels per
+    band; when a single row of blocks is larger than that, the native
+    blocks are yielded instead.
+    """
+    block_height, block_width = src.block_shapes[0]
+    rows_per_window = max_pixels // (src.width * block_height)
+    if rows_per_window < 1:
+        for _, window in src.block_windows(1):
+            yield window
+        return
+
+    strip_height = rows_per_window * block_height
+    for row_off in range(0, src.height, strip_height):
+        yield Window(0, row_off, src.width, min(strip_height, src.height - row_off))
+
+
+def map_windows(src_path, dst_path, function, max_pixels=DEFAULT_MAX_PIXELS, **profile):
+    """
+    Applies function(data, window) to every block-aligned window of a
+    raster and writes the returned arrays to dst_path. data holds all bands
+    of the window, shaped (bands, rows, columns); the result must have the
+    output band count. Extra keyword arguments update the output profile.
+    Band descriptions are carried over when the band count is unchanged.
+    """
+    with rasterio.open(src_path) as src:
+        out_profile = src.profile.copy()
+        out_profile.update(profile)
+        with rasterio.open(dst_path, 'w', **out_profile) as dst:
+            if dst.count == src.count:
+                for index, description in enumerate(src.descriptions, start=1):
+                    if description:
+                        dst.set_band_description(index, description)
+            for window in block_windows(src, max_pixels):
+                dst.write(function(src.read(window=window), window), window=window)
+    return dst_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Set the band descriptions of NDFI GeoTIFF stacks in place.')
+    parser.add_argument('input_dir', help='Directory containing the .tif files')
+    parser.add_argument('--names', nargs='+', default=DEFAULT_BAND_NAMES,
+                        help='Band names, one per band (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of files processed concurrently')
+    args = parser.parse_args()
+
+    tif_files = sorted(Path(args.input_dir).glob('*.tif'))
+    failed = 0
+    for path, error in rename_bands(tif_files, args.names, args.workers):
+        if error is None:
+            print(f"Processed: {path.name}")
+        else:
+            failed += 1
+            print(f"Failed: {path.name}: {error}")
+
+    if failed:
+        raise SystemExit(f"{failed} of {len(tif_files)} files failed")
+    print("All files processed successfully!")
+
+
+if __name__ == '__main__':
+    main()
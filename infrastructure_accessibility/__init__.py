@@ -1,13 +1,14 @@
-from qgis.core import QgsApplication
-from .infrastructure_accessibility_algorithm import InfrastructureAccessibilityProvider
-
 def classFactory(iface):
     """Load the plugin.
-    
+
     :param iface: A QGIS interface instance.
     :type iface: QgsInterface
     """
+    # Imported here so that loading the package stays cheap
+    from qgis.core import QgsApplication
+    from .provider import InfrastructureAccessibilityProvider
+
     provider = InfrastructureAccessibilityProvider()
     provider.iface = iface  # Store iface reference
     QgsApplication.processingRegistry().addProvider(provider)
-    return provider 
\ No newline at end of file
+    return provider
@@ -0,0 +1,164 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+GeoParquet input and output for the accessibility pipeline.
+
+Inputs are read as memory-mapped Arrow tables and scored with the
+vectorized distance engine; the output is the cooperatives table with
+the score column appended, written back as GeoParquet. No QgsFeature is
+ever built. Requires PyArrow, NumPy and Shapely 2.
+"""
+
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from .engine import DistanceIndex, band_scores, geometries_from_wkb, search_distance
+from .scoring import combined_score
+
+# GeoArrow native encodings and the Shapely type they decode to
+NATIVE_ENCODINGS = {
+    'point': shapely.GeometryType.POINT,
+    'linestring': shapely.GeometryType.LINESTRING,
+    'polygon': shapely.GeometryType.POLYGON,
+    'multipoint': shapely.GeometryType.MULTIPOINT,
+    'multilinestring': shapely.GeometryType.MULTILINESTRING,
+    'multipolygon': shapely.GeometryType.MULTIPOLYGON,
+}
+
+
+def geo_metadata(schema):
+    """
+    Returns the decoded GeoParquet 'geo' metadata of an Arrow schema.
+    """
+    metadata = schema.metadata or {}
+    if b'geo' not in metadata:
+        raise ValueError('Not a GeoParquet file: the "geo" metadata is missing')
+    return json.loads(metadata[b'geo'])
+
+
+def read_geoparquet(path, columns=None, memory_map=True):
+    """
+    Reads a GeoParquet file as an Arrow table, memory-mapped by default.
+    Returns the table, the primary geometry column name and its column
+    metadata. When columns is given only those and the geometry column
+    are read.
+    """
+    geo = geo_metadata(pq.read_schema(path, memory_map=memory_map))
+    geometry_column = geo['primary_column']
+    if columns is not None:
+        columns = list(columns) + [geometry_column]
+    table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    return table, geometry_column, geo['columns'][geometry_column]
+
+
+def _native_geometries(values, encoding):
+    """
+    Decodes a GeoArrow native geometry column. The coordinate and offset
+    buffers are handed to Shapely without copying when they have no nulls.
+    """
+    array = values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values
+    geometry_type = NATIVE_ENCODINGS[encoding]
+    valid = None if array.null_count == 0 else array.is_valid().to_numpy(zero_copy_only=False)
+
+    offsets = []
+    while pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+        offsets.append(array.offsets.to_numpy())
+        array = array.values
+
+    if pa.types.is_struct(array.type):
+        coords = np.column_stack([
+            array.field(index).to_numpy(zero_copy_only=False)
+            for index in range(array.type.num_fields)
+        ])
+    else:
+        # Interleaved fixed size list of xy or xyz; the coordinates of null
+        # geometries may be null too, they are copied as NaN
+        width = array.type.list_size
+        coords = array.values.to_numpy(zero_copy_only=False).reshape(-1, width)
+
+    if geometry_type == shapely.GeometryType.POINT:
+        geometries = shapely.points(coords)
+    else:
+        # Shapely expects the innermost offsets first
+        geometries = shapely.from_ragged_array(geometry_type, coords, tuple(reversed(offsets)))
+
+    if valid is not None:
+        geometries = np.where(valid, geometries, None)
+    return geometries
+
+
+def geometry_array(table, geometry_column, column_metadata):
+    """
+    Returns a Shapely geometry array for the geometry column of a table.
+    """
+    values = table.column(geometry_column)
+    encoding = column_metadata.get('encoding', 'WKB')
+    if encoding.lower() == 'wkb':
+        return geometries_from_wkb(values.to_numpy(zero_copy_only=False))
+    if encoding.lower() in NATIVE_ENCODINGS:
+        return _native_geometries(values, encoding.lower())
+    raise ValueError('Unsupported GeoParquet geometry encoding: {}'.format(encoding))
+
+
+def _read_geometries(path):
+    table, geometry_column, column_metadata = read_geoparquet(path, columns=[])
+    return geometry_array(table, geometry_column, column_metadata), column_metadata.get('crs')
+
+
+def score_geoparquet(cooperatives_path, roads_path, markets_path, output_path,
+                     road_distance, market_distance, road_weight,
+                     score_column='accessibility_score', feedback=None):
+    """
+    Scores the cooperatives of a GeoParquet file and writes them, with
+    the score column appended, to output_path. Returns the number of
+    scored cooperatives.
+    """
+    cooperatives, geometry_column, column_metadata = read_geoparquet(cooperatives_path)
+    if score_column in cooperatives.column_names:
+        raise ValueError('The cooperatives already have a "{}" column'.format(score_column))
+    coop_geometries = geometry_array(cooperatives, geometry_column, column_metadata)
+
+    road_geometries, road_crs = _read_geometries(roads_path)
+    market_geometries, market_crs = _read_geometries(markets_path)
+    crs = column_metadata.get('crs')
+    if road_crs != crs or market_crs != crs:
+        raise ValueError('The cooperatives, roads and markets must share the same CRS')
+
+    if feedback is not None:
+        feedback.pushInfo('Indexing {} roads and {} markets...'.format(
+            len(road_geometries), len(market_geometries)))
+        if feedback.isCanceled():
+            return 0
+
+    road_distances = DistanceIndex(road_geometries).nearest_distances(
+        coop_geometries, search_distance(road_distance))
+    if feedback is not None:
+        feedback.setProgress(45)
+        if feedback.isCanceled():
+            return 0
+    market_distances = DistanceIndex(market_geometries).nearest_distances(
+        coop_geometries, search_distance(market_distance))
+    if feedback is not None:
+        feedback.setProgress(90)
+
+    scores = combined_score(
+        band_scores(road_distances, road_distance),
+        band_scores(market_distances, market_distance),
+        road_weight
+    )
+
+    output = cooperatives.append_column(score_column, pa.array(scores, type=pa.float64()))
+    output = output.replace_schema_metadata(cooperatives.schema.metadata)
+    pq.write_table(output, output_path)
+    return len(scores)
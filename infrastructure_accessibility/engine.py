@@ -0,0 +1,181 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Vectorized distance engine.
+
+Computes exact nearest distances from many geometries to an indexed set
+of infrastructure geometries in bulk, and turns them into ring scores
+with array operations, and assigns points to their nearest target point
+with bulk KD-tree queries. Requires NumPy and Shapely 2; the KD-tree
+functions also require SciPy.
+"""
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from .scoring import RING_MULTIPLIERS, ring_score
+
+
+def geometries_from_wkb(values):
+    """
+    Returns a Shapely geometry array from a sequence of WKB values.
+    Missing values become None.
+    """
+    return shapely.from_wkb(np.asarray(values, dtype=object))
+
+
+def geometries_from_features(features):
+    """
+    Returns the feature ids and a Shapely geometry array for an iterable
+    of QgsFeature. Features without a geometry get None.
+    """
+    ids = []
+    wkb = []
+    for feature in features:
+        ids.append(feature.id())
+        geometry = feature.geometry()
+        wkb.append(None if geometry.isNull() else bytes(geometry.asWkb()))
+    return ids, geometries_from_wkb(wkb)
+
+
+class DistanceIndex:
+    """
+    STRtree over infrastructure geometries answering bulk nearest
+    distance queries.
+    """
+
+    def __init__(self, geometries):
+        geometries = np.asarray(geometries, dtype=object)
+        keep = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+        self.geometries = geometries[keep]
+        self.tree = STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def nearest(self, geometries, max_distance=None):
+        """
+        Returns the index of the nearest indexed geometry and the distance
+        to it for every input geometry. Inputs with nothing within
+        max_distance, or without a geometry, get index -1 and distance NaN.
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        indices = np.full(len(geometries), -1, dtype=np.int64)
+        distances = np.full(len(geometries), np.nan)
+        if not len(self.geometries) or not len(geometries):
+            return indices, distances
+
+        valid = np.flatnonzero(~(shapely.is_missing(geometries) | shapely.is_empty(geometries)))
+        (inputs, targets), found = self.tree.query_nearest(
+            geometries[valid],
+            max_distance=max_distance,
+            return_distance=True,
+            all_matches=False
+        )
+        indices[valid[inputs]] = targets
+        distances[valid[inputs]] = found
+        return indices, distances
+
+    def nearest_distances(self, geometries, max_distance=None):
+        """
+        Returns the distance to the nearest indexed geometry for every input
+        geometry, NaN where nothing lies within max_distance.
+        """
+        return self.nearest(geometries, max_distance)[1]
+
+
+def search_distance(buffer_distance):
+    """
+    Returns the largest distance that can still contribute to a score, or
+    None for an unbounded search when the buffer distance is 0: Shapely
+    needs a positive search distance, and with a buffer distance of 0 only
+    geometries at distance 0 score.
+    """
+    distance = np.max(buffer_distance) * RING_MULTIPLIERS[-1]
+    return distance if distance > 0 else None
+
+
+def band_scores(distances, buffer_distance):
+    """
+    Vectorized scoring.band_score. Distances and buffer distances are
+    broadcast against each other, so one distance vector can be scored
+    against many buffer distances at once. NaN distances score 0.
+    """
+    distances = np.asarray(distances, dtype=float)
+    buffer_distance = np.asarray(buffer_distance, dtype=float)
+    scores = np.zeros(np.broadcast(distances, buffer_distance).shape)
+    with np.errstate(invalid='ignore'):
+        for multiplier in reversed(RING_MULTIPLIERS):
+            ring = buffer_distance * multiplier
+            scores = np.where(distances <= ring, ring_score(ring), scores)
+    return scores
+
+
+def point_coordinates(geometries):
+    """
+    Returns an (n, 2) array of point coordinates. Multipart geometries
+    use their centroid; missing geometries get NaN.
+    """
+    centroids = shapely.centroid(np.asarray(geometries, dtype=object))
+    return np.column_stack([shapely.get_x(centroids), shapely.get_y(centroids)])
+
+
+def nearest_points(xy, target_xy, max_distance=np.inf):
+    """
+    Assigns every point to its nearest target point with a single bulk
+    KD-tree query. Returns the target indices and distances; points with
+    NaN coordinates or no target within max_distance get -1 and NaN.
+    Targets at identical locations are merged into the first of them.
+    Requires SciPy.
+    """
+    from scipy.spatial import cKDTree
+
+    indices = np.full(len(xy), -1, dtype=np.int64)
+    distances = np.full(len(xy), np.nan)
+    target_valid = np.flatnonzero(~np.isnan(target_xy).any(axis=1))
+    valid = np.flatnonzero(~np.isnan(xy).any(axis=1))
+    if not len(target_valid) or not len(valid):
+        return indices, distances
+
+    # np.unique returns the first occurrence of every location
+    unique_xy, first = np.unique(target_xy[target_valid], axis=0, return_index=True)
+    found, nearest = cKDTree(unique_xy).query(
+        xy[valid], k=1, distance_upper_bound=max_distance)
+    hit = np.isfinite(found)
+    indices[valid[hit]] = target_valid[first[nearest[hit]]]
+    distances[valid[hit]] = found[hit]
+    return indices, distances
+
+
+def voronoi_cells(xy, extent):
+    """
+    Returns the Voronoi cell of every point, clipped to the extent
+    geometry. Of the points at identical locations only the first gets
+    the cell, matching nearest_points; the others and points with NaN
+    coordinates get None.
+    """
+    cells = np.full(len(xy), None, dtype=object)
+    valid = np.flatnonzero(~np.isnan(xy).any(axis=1))
+    if not len(valid):
+        return cells
+
+    _, first = np.unique(xy[valid], axis=0, return_index=True)
+    valid = valid[np.sort(first)]
+    points = shapely.points(xy[valid])
+    if len(valid) == 1:
+        cells[valid] = extent
+        return cells
+
+    parts = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent))
+    # Voronoi cells are not returned in input order, match them back to their generator point
+    point_index, cell_index = STRtree(parts).query(points, predicate='within')
+    cells[valid[point_index]] = shapely.intersection(parts[cell_index], extent)
+    return cells
@@ -0,0 +1,185 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingException
+)
+
+
+class GeoParquetAccessibilityAlgorithm(QgsProcessingAlgorithm):
+    """
+    Infrastructure Accessibility analysis on GeoParquet files.
+    Reads the inputs as Arrow tables and writes the cooperatives back as
+    GeoParquet with the accessibility score column appended.
+    """
+
+    # Constants used to refer to parameters and outputs
+    INPUT_COOPERATIVES = 'INPUT_COOPERATIVES'
+    INPUT_ROADS = 'INPUT_ROADS'
+    INPUT_MARKETS = 'INPUT_MARKETS'
+    ROAD_BUFFER_DISTANCE = 'ROAD_BUFFER_DISTANCE'
+    MARKET_BUFFER_DISTANCE = 'MARKET_BUFFER_DISTANCE'
+    ROAD_WEIGHT = 'ROAD_WEIGHT'
+    OUTPUT = 'OUTPUT'
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return GeoParquetAccessibilityAlgorithm()
+
+    def name(self):
+        """
+        Returns the algorithm name.
+        """
+        return 'geoparquetaccessibility'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Infrastructure Accessibility Analysis (GeoParquet)')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('Infrastructure Analysis')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group.
+        """
+        return 'infrastructureanalysis'
+
+    def shortHelpString(self):
+        """
+        Returns a short helper string for the algorithm.
+        """
+        return self.tr('''
+        Calculates accessibility scores for cooperatives stored as GeoParquet,
+        without converting them to vector layers.
+
+        Parameters:
+            - Cooperatives, roads and markets GeoParquet files (same CRS),
+              with WKB or GeoArrow native geometry columns
+            - Buffer distances for roads and markets
+            - Weight for road accessibility vs market accessibility
+
+        Outputs the cooperatives as GeoParquet with an accessibility_score column.
+        Requires the PyArrow, NumPy and Shapely 2 Python packages.
+        ''')
+
+    def initAlgorithm(self, config=None):
+        """
+        Define the inputs and outputs of the algorithm.
+        """
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_COOPERATIVES,
+                self.tr('Cooperatives GeoParquet'),
+                extension='parquet'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_ROADS,
+                self.tr('Roads GeoParquet'),
+                extension='parquet'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT_MARKETS,
+                self.tr('Markets GeoParquet'),
+                extension='parquet'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ROAD_BUFFER_DISTANCE,
+                self.tr('Road Buffer Distance (meters)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1000,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MARKET_BUFFER_DISTANCE,
+                self.tr('Market Buffer Distance (meters)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=2000,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ROAD_WEIGHT,
+                self.tr('Road Accessibility Weight (0-1)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.6,
+                minValue=0,
+                maxValue=1
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUTPUT,
+                self.tr('Output GeoParquet'),
+                self.tr('GeoParquet files (*.parquet)')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Process the algorithm.
+        """
+        try:
+            from .columnar import score_geoparquet
+        except ImportError as e:
+            raise QgsProcessingException(
+                self.tr('GeoParquet analysis requires PyArrow, NumPy and Shapely 2: {}').format(e))
+
+        cooperatives = self.parameterAsFile(parameters, self.INPUT_COOPERATIVES, context)
+        roads = self.parameterAsFile(parameters, self.INPUT_ROADS, context)
+        markets = self.parameterAsFile(parameters, self.INPUT_MARKETS, context)
+        road_distance = self.parameterAsInt(parameters, self.ROAD_BUFFER_DISTANCE, context)
+        market_distance = self.parameterAsInt(parameters, self.MARKET_BUFFER_DISTANCE, context)
+        road_weight = self.parameterAsDouble(parameters, self.ROAD_WEIGHT, context)
+        output = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+
+        try:
+            count = score_geoparquet(
+                cooperatives, roads, markets, output,
+                road_distance, market_distance, road_weight,
+                feedback=feedback
+            )
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+        feedback.pushInfo('Scored {} cooperatives'.format(count))
+
+        return {self.OUTPUT: output}
@@ -9,6 +9,8 @@
 ***************************************************************************
 """
 
+import math
+
 from qgis.PyQt.QtCore import QCoreApplication, QVariant
 from qgis.PyQt.QtGui import QColor
 from qgis.core import (
@@ -16,17 +18,25 @@ from qgis.core import (
     QgsProcessingAlgorithm,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterDefinition,
     QgsField,
+    QgsFeatureRequest,
     QgsFeatureSink,
+    QgsGeometry,
     QgsSymbol,
     QgsGraduatedSymbolRenderer,
     QgsGradientColorRamp,
     QgsProcessingUtils,
-    QgsProcessingException,
-    QgsProcessingProvider
+    QgsProcessingException
 )
-import processing
+
+from .scoring import band_score, combined_score, ring_distances
+
+# Processing and the scoring backends are imported by the methods that use
+# them, so registering the provider at QGIS startup stays cheap
+
 
 class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
     """
@@ -42,7 +52,12 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
     ROAD_BUFFER_DISTANCE = 'ROAD_BUFFER_DISTANCE'
     MARKET_BUFFER_DISTANCE = 'MARKET_BUFFER_DISTANCE'
     ROAD_WEIGHT = 'ROAD_WEIGHT'
+    DATABASE_PUSHDOWN = 'DATABASE_PUSHDOWN'
+    SCORE_CACHE_CELL_SIZE = 'SCORE_CACHE_CELL_SIZE'
+    ROAD_MEMORY_BUDGET = 'ROAD_MEMORY_BUDGET'
+    INPUT_ZONES = 'INPUT_ZONES'
     OUTPUT = 'OUTPUT'
+    OUTPUT_ZONES = 'OUTPUT_ZONES'
 
     def tr(self, string):
         """
@@ -90,8 +105,29 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
             - Markets layer (point)
             - Buffer distances for roads and markets
             - Weight for road accessibility vs market accessibility
+            - Database pushdown (advanced): when all layers live in the same
+              PostGIS, SpatiaLite or GeoPackage database, compute the scores
+              with a single SQL query using the database's spatial indexes
+            - Score cache cell size (advanced): snap cooperatives to a grid
+              and reuse the ring score of cells lying inside a single ring
+              band; speeds up dense, clustered layers
+            - Road memory budget (advanced): score roads out of core for
+              road layers larger than memory. Roads are streamed to a
+              disk-backed packed R-tree in Hilbert order and only the
+              segments near each tile of cooperatives are paged in
+            - Zones layer (polygon, optional): districts to aggregate the
+              scores over
             
+        The default analysis scores a cooperative by the first buffer it
+        falls in, in layer order. The database pushdown, score cache and
+        out-of-core modes score it by the innermost ring of any road or
+        market, so where a cooperative lies in the buffers of several
+        features they can give a higher score than the default analysis.
+
         Outputs a new layer with accessibility scores and graduated styling.
+        When zones are given, also outputs the zones with the count, mean,
+        min, max, standard deviation and 10th, 50th and 90th percentile of
+        the scores of the cooperatives inside them.
         ''')
 
     def initAlgorithm(self, config=None):
@@ -155,6 +191,43 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        pushdown_param = QgsProcessingParameterBoolean(
+            self.DATABASE_PUSHDOWN,
+            self.tr('Compute scores in the database when all layers share one'),
+            defaultValue=False
+        )
+        pushdown_param.setFlags(pushdown_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(pushdown_param)
+
+        cache_param = QgsProcessingParameterNumber(
+            self.SCORE_CACHE_CELL_SIZE,
+            self.tr('Score cache cell size (meters, 0 disables the cache)'),
+            QgsProcessingParameterNumber.Double,
+            defaultValue=0,
+            minValue=0
+        )
+        cache_param.setFlags(cache_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cache_param)
+
+        budget_param = QgsProcessingParameterNumber(
+            self.ROAD_MEMORY_BUDGET,
+            self.tr('Out-of-core road memory budget (MB, 0 keeps roads in memory)'),
+            QgsProcessingParameterNumber.Integer,
+            defaultValue=0,
+            minValue=0
+        )
+        budget_param.setFlags(budget_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(budget_param)
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_ZONES,
+                self.tr('Zones Layer'),
+                [QgsProcessing.TypeVectorPolygon],
+                optional=True
+            )
+        )
+
         # Add output parameter
         self.addParameter(
             QgsProcessingParameterFeatureSink(
@@ -163,6 +236,16 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_ZONES,
+                self.tr('Zone Statistics'),
+                QgsProcessing.TypeVectorPolygon,
+                optional=True,
+                createByDefault=False
+            )
+        )
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Process the algorithm.
@@ -174,62 +257,64 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
         road_distance = self.parameterAsInt(parameters, self.ROAD_BUFFER_DISTANCE, context)
         market_distance = self.parameterAsInt(parameters, self.MARKET_BUFFER_DISTANCE, context)
         road_weight = self.parameterAsDouble(parameters, self.ROAD_WEIGHT, context)
-        market_weight = 1 - road_weight
+        use_pushdown = self.parameterAsBool(parameters, self.DATABASE_PUSHDOWN, context)
+        cache_cell_size = self.parameterAsDouble(parameters, self.SCORE_CACHE_CELL_SIZE, context)
+        road_memory_budget = self.parameterAsInt(parameters, self.ROAD_MEMORY_BUDGET, context)
+        zones = self.parameterAsVectorLayer(parameters, self.INPUT_ZONES, context)
 
         if feedback.isCanceled():
             return {}
 
-        # Create road buffers
-        feedback.pushInfo('Creating road buffers...')
-        road_buffers = processing.run(
-            "native:multiplebuffer",
-            {
-                'INPUT': roads,
-                'DISTANCE': [road_distance, road_distance * 2, road_distance * 5],
-                'SEGMENTS': 5,
-                'DISSOLVE': False,
-                'OUTPUT': 'memory:'
-            },
-            context=context,
-            feedback=feedback
-        )['OUTPUT']
+        self.zone_statistics = None
+        if zones is not None:
+            from .zonal import ZoneStatistics
+            feedback.pushInfo('Indexing zones...')
+            self.zone_statistics = ZoneStatistics(
+                zones, cooperatives.sourceCrs(), context.transformContext(), feedback)
+
+        if use_pushdown:
+            from . import pushdown
+            tables = pushdown.shared_database(cooperatives, roads, markets)
+            if tables is None:
+                feedback.pushInfo('Layers do not share a PostGIS, SpatiaLite or GeoPackage database and a CRS')
+            else:
+                tables = pushdown.prepare_tables(tables, feedback)
+            if tables is not None:
+                return self.processPushdown(
+                    parameters, context, feedback, cooperatives, tables,
+                    road_distance, market_distance, road_weight
+                )
+            feedback.pushInfo('Falling back to buffer analysis')
 
-        if feedback.isCanceled():
-            return {}
+        market_weight = 1 - road_weight
 
         # Create market buffers
         feedback.pushInfo('Creating market buffers...')
-        market_buffers = processing.run(
-            "native:multiplebuffer",
-            {
-                'INPUT': markets,
-                'DISTANCE': [market_distance, market_distance * 2, market_distance * 5],
-                'SEGMENTS': 5,
-                'DISSOLVE': False,
-                'OUTPUT': 'memory:'
-            },
-            context=context,
-            feedback=feedback
-        )['OUTPUT']
+        market_buffers = self.createBuffers(markets, market_distance, context, feedback)
 
         if feedback.isCanceled():
             return {}
 
-        # Prepare output layer
-        fields = cooperatives.fields()
-        fields.append(QgsField('accessibility_score', QVariant.Double))
-        
-        (sink, dest_id) = self.parameterAsSink(
-            parameters,
-            self.OUTPUT,
-            context,
-            fields,
-            cooperatives.wkbType(),
-            cooperatives.sourceCrs()
-        )
+        if road_memory_budget > 0:
+            return self.processOutOfCore(
+                parameters, context, feedback, cooperatives, roads, market_buffers,
+                road_distance, market_distance, road_weight, road_memory_budget
+            )
 
-        if sink is None:
-            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+        # Create road buffers
+        feedback.pushInfo('Creating road buffers...')
+        road_buffers = self.createBuffers(roads, road_distance, context, feedback)
+
+        if feedback.isCanceled():
+            return {}
+
+        if cache_cell_size > 0:
+            return self.processCached(
+                parameters, context, feedback, cooperatives, road_buffers, market_buffers,
+                road_distance, market_distance, road_weight, cache_cell_size
+            )
+
+        sink, dest_id = self.prepareSink(parameters, context, cooperatives)
 
         # Calculate accessibility scores
         total = 100.0 / cooperatives.featureCount() if cooperatives.featureCount() else 0
@@ -262,10 +347,313 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
             out_feat = feature
             out_feat.setAttributes(feature.attributes() + [total_score])
             sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+            self.addToZones(feature, total_score)
+
+            feedback.setProgress(int(current * total))
+
+        return self.finishOutputs(parameters, context, feedback, dest_id)
+
+    def createBuffers(self, layer, distance, context, feedback):
+        """
+        Creates the three buffer rings around the features of a layer.
+        """
+        import processing
+
+        return processing.run(
+            "native:multiplebuffer",
+            {
+                'INPUT': layer,
+                'DISTANCE': ring_distances(distance),
+                'SEGMENTS': 5,
+                'DISSOLVE': False,
+                'OUTPUT': 'memory:'
+            },
+            context=context,
+            feedback=feedback
+        )['OUTPUT']
+
+    def processOutOfCore(self, parameters, context, feedback, cooperatives, roads, market_buffers,
+                         road_distance, market_distance, road_weight, budget_mb):
+        """
+        Scores the cooperatives against roads kept on disk. Roads are
+        streamed into a memory-mapped packed R-tree; cooperatives are then
+        processed tile by tile in Hilbert order, paging in only the road
+        segments near each tile. Half of the budget bounds the external sort
+        of the road index, the other half the cache of paged-in segments.
+        """
+        import shutil
+        import tempfile
+
+        from .packed_rtree import PackedRTree, SegmentCache, hilbert_value
+        from .ring_bands import RingBands
+
+        budget = budget_mb * 1024 * 1024
+        search = ring_distances(road_distance)[-1]
+        directory = tempfile.mkdtemp(dir=QgsProcessingUtils.tempFolder())
+
+        def segments():
+            for feature in roads.getFeatures():
+                if feedback.isCanceled():
+                    break
+                if not feature.hasGeometry():
+                    continue
+                for part in feature.geometry().asGeometryCollection():
+                    bbox = part.boundingBox()
+                    yield (bbox.xMinimum(), bbox.yMinimum(), bbox.xMaximum(), bbox.yMaximum()), bytes(part.asWkb())
+
+        def decode(wkb):
+            geometry = QgsGeometry()
+            geometry.fromWkb(bytes(wkb))
+            return geometry
+
+        tree = None
+        try:
+            feedback.pushInfo('Streaming roads into a disk-backed index...')
+            road_extent = roads.extent()
+            tree, runs, sort_peak = PackedRTree.build(
+                segments(),
+                (road_extent.xMinimum(), road_extent.yMinimum(), road_extent.xMaximum(), road_extent.yMaximum()),
+                directory,
+                budget // 2
+            )
+            cache = SegmentCache(tree, budget // 2, decode)
+
+            if feedback.isCanceled():
+                return {}
+
+            market_bands = RingBands(market_buffers, market_distance, feedback)
+
+            # Group the cooperatives into tiles, visited in Hilbert order
+            tile_size = max(search * 2, 1)
+            tiles = {}
+            for feature in cooperatives.getFeatures(QgsFeatureRequest().setNoAttributes()):
+                key = None
+                if feature.hasGeometry():
+                    center = feature.geometry().boundingBox().center()
+                    key = (math.floor(center.x() / tile_size), math.floor(center.y() / tile_size))
+                tiles.setdefault(key, []).append(feature.id())
+
+            coop_extent = cooperatives.extent()
+            tile_extent = (
+                coop_extent.xMinimum() / tile_size, coop_extent.yMinimum() / tile_size,
+                coop_extent.xMaximum() / tile_size, coop_extent.yMaximum() / tile_size
+            )
+            ordered = sorted(
+                tiles,
+                key=lambda key: -1 if key is None else hilbert_value(key[0] + 0.5, key[1] + 0.5, tile_extent)
+            )
+
+            sink, dest_id = self.prepareSink(parameters, context, cooperatives)
+
+            total = 100.0 / cooperatives.featureCount() if cooperatives.featureCount() else 0
+            current = 0
+
+            for key in ordered:
+                if feedback.isCanceled():
+                    break
+
+                if key is not None:
+                    # Page in the segments that can reach this tile
+                    for offset, length in tree.search(
+                            key[0] * tile_size - search, key[1] * tile_size - search,
+                            (key[0] + 1) * tile_size + search, (key[1] + 1) * tile_size + search):
+                        cache.get(offset, length)
+
+                for feature in cooperatives.getFeatures(QgsFeatureRequest().setFilterFids(tiles[key])):
+                    if feedback.isCanceled():
+                        break
+
+                    point = feature.geometry()
+                    if point.isNull():
+                        road_score = market_score = 0
+                    else:
+                        road_score = band_score(self.nearestRoadDistance(tree, cache, point, search), road_distance)
+                        market_score = market_bands.score(point)
+                    total_score = combined_score(road_score, market_score, road_weight)
+
+                    out_feat = feature
+                    out_feat.setAttributes(feature.attributes() + [total_score])
+                    sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+                    self.addToZones(feature, total_score)
+
+                    current += 1
+                    feedback.setProgress(int(current * total))
+
+            feedback.pushInfo(
+                'Road index: {} segments, {} sort runs, sort peak {:.1f} MB of {:.1f} MB. '
+                'Segment cache: peak {:.1f} MB of {:.1f} MB, {} segments paged in'.format(
+                    len(tree), runs, sort_peak / 1048576.0, (budget // 2) / 1048576.0,
+                    cache.peak / 1048576.0, cache.budget / 1048576.0, cache.loads))
+        finally:
+            if tree is not None:
+                tree.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        return self.finishOutputs(parameters, context, feedback, dest_id)
+
+    def nearestRoadDistance(self, tree, cache, geometry, search):
+        """
+        Returns the distance from a geometry to the nearest road segment
+        within search distance, or None.
+        """
+        bbox = geometry.boundingBox()
+        nearest = None
+        for offset, length in tree.search(
+                bbox.xMinimum() - search, bbox.yMinimum() - search,
+                bbox.xMaximum() + search, bbox.yMaximum() + search):
+            distance = cache.get(offset, length).distance(geometry)
+            if nearest is None or distance < nearest:
+                nearest = distance
+        return nearest
+
+    def processCached(self, parameters, context, feedback, cooperatives, road_buffers, market_buffers,
+                      road_distance, market_distance, road_weight, cell_size):
+        """
+        Scores the cooperatives against dissolved ring bands, reusing the
+        score of grid cells that lie inside a single band.
+        """
+        from .ring_bands import RingBands, CellScoreCache
+
+        feedback.pushInfo('Dissolving buffer rings...')
+        road_cache = CellScoreCache(RingBands(road_buffers, road_distance, feedback), cell_size)
+        market_cache = CellScoreCache(RingBands(market_buffers, market_distance, feedback), cell_size)
+
+        if feedback.isCanceled():
+            return {}
+
+        sink, dest_id = self.prepareSink(parameters, context, cooperatives)
+
+        total = 100.0 / cooperatives.featureCount() if cooperatives.featureCount() else 0
+
+        for current, feature in enumerate(cooperatives.getFeatures()):
+            if feedback.isCanceled():
+                break
+
+            point = feature.geometry()
+            total_score = combined_score(road_cache.score(point), market_cache.score(point), road_weight)
+
+            out_feat = feature
+            out_feat.setAttributes(feature.attributes() + [total_score])
+            sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+            self.addToZones(feature, total_score)
+
+            feedback.setProgress(int(current * total))
+
+        for name, cache in (('Road', road_cache), ('Market', market_cache)):
+            feedback.pushInfo('{} scores: {} from {} cached cells, {} tested exactly'.format(
+                name, cache.hits, len(cache.cells), cache.exact))
+
+        return self.finishOutputs(parameters, context, feedback, dest_id)
+
+    def processPushdown(self, parameters, context, feedback, cooperatives, tables,
+                        road_distance, market_distance, road_weight):
+        """
+        Computes the scores with a single query in the shared database and
+        streams them into the output layer.
+        """
+        from . import pushdown
+
+        feedback.pushInfo('Computing scores in the {} database...'.format(tables[0].provider))
+        scores = pushdown.pushdown_scores(tables, road_distance, market_distance, feedback)
+
+        if feedback.isCanceled():
+            return {}
+
+        sink, dest_id = self.prepareSink(parameters, context, cooperatives)
+
+        # Match rows by the key column when it is a field, otherwise by feature id
+        key_index = cooperatives.fields().lookupField(tables[0].key_column)
+
+        total = 100.0 / cooperatives.featureCount() if cooperatives.featureCount() else 0
+
+        for current, feature in enumerate(cooperatives.getFeatures()):
+            if feedback.isCanceled():
+                break
+
+            key = feature.attributes()[key_index] if key_index >= 0 else feature.id()
+            road_score, market_score = scores.get(key, (0, 0))
+            total_score = combined_score(road_score, market_score, road_weight)
+
+            out_feat = feature
+            out_feat.setAttributes(feature.attributes() + [total_score])
+            sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+            self.addToZones(feature, total_score)
 
             feedback.setProgress(int(current * total))
 
-        # Style the output layer
+        return self.finishOutputs(parameters, context, feedback, dest_id)
+
+    def prepareSink(self, parameters, context, cooperatives):
+        """
+        Creates the output sink with the cooperative fields and the score field.
+        """
+        fields = cooperatives.fields()
+        fields.append(QgsField('accessibility_score', QVariant.Double))
+        
+        (sink, dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            cooperatives.wkbType(),
+            cooperatives.sourceCrs()
+        )
+
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        return sink, dest_id
+
+    def addToZones(self, feature, score):
+        """
+        Adds a scored cooperative to the zone statistics, if any.
+        """
+        if self.zone_statistics is not None:
+            self.zone_statistics.add(feature.geometry(), score)
+
+    def finishOutputs(self, parameters, context, feedback, dest_id):
+        """
+        Styles the output layer, writes the zone statistics and returns
+        the algorithm results.
+        """
+        self.styleOutput(dest_id, context)
+        results = {self.OUTPUT: dest_id}
+
+        if self.zone_statistics is None or feedback.isCanceled():
+            return results
+
+        from .zonal import ZONE_PERCENTILES
+
+        zones = self.parameterAsVectorLayer(parameters, self.INPUT_ZONES, context)
+        fields = zones.fields()
+        fields.append(QgsField('score_count', QVariant.Int))
+        for name in ['score_mean', 'score_min', 'score_max', 'score_std'] + \
+                ['score_p{}'.format(q) for q in ZONE_PERCENTILES]:
+            fields.append(QgsField(name, QVariant.Double))
+
+        (zone_sink, zone_dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT_ZONES,
+            context,
+            fields,
+            zones.wkbType(),
+            zones.sourceCrs()
+        )
+        if zone_sink is None:
+            feedback.pushInfo('No zone statistics output set, skipping zone statistics')
+            return results
+
+        for zone in zones.getFeatures():
+            zone.setAttributes(zone.attributes() + self.zone_statistics.values(zone.id()))
+            zone_sink.addFeature(zone, QgsFeatureSink.FastInsert)
+
+        results[self.OUTPUT_ZONES] = zone_dest_id
+        return results
+
+    def styleOutput(self, dest_id, context):
+        """
+        Applies a graduated red to green style on the accessibility score.
+        """
         layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
         if layer:
             symbol = QgsSymbol.defaultSymbol(layer.geometryType())
@@ -286,31 +674,3 @@ class InfrastructureAccessibilityAlgorithm(QgsProcessingAlgorithm):
             layer.setRenderer(renderer)
             layer.triggerRepaint()
 
-        return {self.OUTPUT: dest_id}
-
-
-class InfrastructureAccessibilityProvider(QgsProcessingProvider):
-    def loadAlgorithms(self):
-        self.addAlgorithm(InfrastructureAccessibilityAlgorithm())
-
-    def id(self):
-        return 'infrastructureaccessibility'
-
-    def name(self):
-        return self.tr('Infrastructure Accessibility')
-
-    def icon(self):
-        return QgsProcessingProvider.icon(self)
-
-    def longName(self):
-        return self.name()
-
-    def initGui(self):
-        """Initialize the GUI elements"""
-        # For Processing providers, we don't need to do anything here
-        pass
-
-    def unload(self):
-        """Unload the provider"""
-        # For Processing providers, we don't need to do anything here
-        pass 
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFeatureSink,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFeatureSink,
+    QgsGeometry,
+    QgsWkbTypes,
+    QgsProcessingException
+)
+
+from .scoring import ring_distances
+
+
+class MarketCatchmentAlgorithm(QgsProcessingAlgorithm):
+    """
+    Market catchment analysis algorithm.
+    Assigns every cooperative to its nearest market and derives each
+    market's service area from Voronoi cells clipped to the distance bands.
+    """
+
+    # Constants used to refer to parameters and outputs
+    INPUT_COOPERATIVES = 'INPUT_COOPERATIVES'
+    INPUT_MARKETS = 'INPUT_MARKETS'
+    MARKET_BUFFER_DISTANCE = 'MARKET_BUFFER_DISTANCE'
+    LOAD_FIELD = 'LOAD_FIELD'
+    OUTPUT_AREAS = 'OUTPUT_AREAS'
+    OUTPUT_ASSIGNMENTS = 'OUTPUT_ASSIGNMENTS'
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return MarketCatchmentAlgorithm()
+
+    def name(self):
+        """
+        Returns the algorithm name.
+        """
+        return 'marketcatchment'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Market Catchment Areas')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('Infrastructure Analysis')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group.
+        """
+        return 'infrastructureanalysis'
+
+    def shortHelpString(self):
+        """
+        Returns a short helper string for the algorithm.
+        """
+        return self.tr('''
+        Computes the catchment of every market: the cooperatives it serves
+        best and the polygon of its service area.
+
+        Parameters:
+            - Cooperatives layer (point)
+            - Markets layer (point)
+            - Market buffer distance, expanded into the same three distance
+              bands as the accessibility analysis
+            - Load field (optional): numeric cooperative field summed into
+              the market load, otherwise the load is the cooperative count
+
+        Outputs the service areas, one polygon per market and distance band
+        (the market's Voronoi cell clipped to the band) with the number of
+        cooperatives and the load served within the band, and the
+        cooperatives with their nearest market and its distance.
+        Markets at the same location are merged into the first of them in
+        layer order, which gets their service area and cooperatives; the
+        others get no service area.
+        Requires the NumPy, Shapely 2 and SciPy Python packages.
+        ''')
+
+    def initAlgorithm(self, config=None):
+        """
+        Define the inputs and outputs of the algorithm.
+        """
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_COOPERATIVES,
+                self.tr('Cooperatives Layer'),
+                [QgsProcessing.TypeVectorPoint]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_MARKETS,
+                self.tr('Markets Layer'),
+                [QgsProcessing.TypeVectorPoint]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MARKET_BUFFER_DISTANCE,
+                self.tr('Market Buffer Distance (meters)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=2000,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.LOAD_FIELD,
+                self.tr('Load Field'),
+                parentLayerParameterName=self.INPUT_COOPERATIVES,
+                type=QgsProcessingParameterField.Numeric,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_AREAS,
+                self.tr('Service Areas'),
+                QgsProcessing.TypeVectorPolygon
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_ASSIGNMENTS,
+                self.tr('Cooperative Assignments'),
+                QgsProcessing.TypeVectorPoint
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Process the algorithm.
+        """
+        try:
+            import numpy as np
+            import shapely
+            import scipy.spatial  # noqa: F401
+            from . import engine
+        except ImportError as e:
+            raise QgsProcessingException(
+                self.tr('Market catchments require NumPy, Shapely 2 and SciPy: {}').format(e))
+
+        cooperatives = self.parameterAsVectorLayer(parameters, self.INPUT_COOPERATIVES, context)
+        markets = self.parameterAsVectorLayer(parameters, self.INPUT_MARKETS, context)
+        market_distance = self.parameterAsInt(parameters, self.MARKET_BUFFER_DISTANCE, context)
+        load_field = self.parameterAsString(parameters, self.LOAD_FIELD, context)
+        rings = ring_distances(market_distance)
+
+        # Work in the cooperatives CRS
+        crs = cooperatives.sourceCrs()
+        request = QgsFeatureRequest().setDestinationCrs(crs, context.transformContext())
+
+        feedback.pushInfo('Reading markets...')
+        market_features = list(markets.getFeatures(request))
+        _, market_geometries = engine.geometries_from_features(market_features)
+        market_xy = engine.point_coordinates(market_geometries)
+        located_xy = market_xy[~np.isnan(market_xy).any(axis=1)]
+        merged = len(located_xy) - len(np.unique(located_xy, axis=0))
+        if merged:
+            feedback.pushInfo('Merging {} markets into earlier markets at the same location'.format(merged))
+
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo('Reading cooperatives...')
+        load_index = cooperatives.fields().lookupField(load_field) if load_field else -1
+        loads = []
+
+        def coop_features():
+            for feature in cooperatives.getFeatures():
+                value = feature.attributes()[load_index] if load_index >= 0 else 1
+                try:
+                    loads.append(float(value))
+                except (TypeError, ValueError):
+                    # NULL loads count as zero
+                    loads.append(0.0)
+                yield feature
+
+        coop_ids, coop_geometries = engine.geometries_from_features(coop_features())
+        coop_xy = engine.point_coordinates(coop_geometries)
+        loads = np.asarray(loads)
+        # The output pass reads the cooperatives again, match them by feature id
+        rows = {fid: row for row, fid in enumerate(coop_ids)}
+
+        if feedback.isCanceled():
+            return {}
+
+        # Nearest market for every cooperative in one KD-tree query
+        feedback.pushInfo('Assigning {} cooperatives to {} markets...'.format(len(coop_xy), len(market_xy)))
+        nearest, distances = engine.nearest_points(coop_xy, market_xy)
+        feedback.setProgress(30)
+
+        counts = []
+        band_loads = []
+        assigned = nearest >= 0
+        for ring in rings:
+            within = assigned & (distances <= ring)
+            counts.append(np.bincount(nearest[within], minlength=len(market_xy)))
+            band_loads.append(np.bincount(nearest[within], weights=loads[within], minlength=len(market_xy)))
+
+        if feedback.isCanceled():
+            return {}
+
+        # Service areas: Voronoi cells clipped to each distance band
+        feedback.pushInfo('Building service areas...')
+        areas = [np.full(len(market_xy), None, dtype=object) for _ in rings]
+        if len(located_xy):
+            minimum = located_xy.min(axis=0) - rings[-1]
+            maximum = located_xy.max(axis=0) + rings[-1]
+            extent = shapely.box(minimum[0], minimum[1], maximum[0], maximum[1])
+            cells = engine.voronoi_cells(market_xy, extent)
+            has_cell = ~shapely.is_missing(cells)
+            centers = shapely.points(market_xy[has_cell])
+            for band, ring in enumerate(rings):
+                areas[band][has_cell] = shapely.intersection(
+                    cells[has_cell], shapely.buffer(centers, ring, quad_segs=5))
+        feedback.setProgress(60)
+
+        if feedback.isCanceled():
+            return {}
+
+        area_fields = markets.fields()
+        area_fields.append(QgsField('ring_distance', QVariant.Double))
+        area_fields.append(QgsField('coop_count', QVariant.Int))
+        area_fields.append(QgsField('load', QVariant.Double))
+
+        (area_sink, area_dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT_AREAS,
+            context,
+            area_fields,
+            QgsWkbTypes.Polygon,
+            crs
+        )
+        if area_sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT_AREAS))
+
+        for index, market in enumerate(market_features):
+            if feedback.isCanceled():
+                break
+            for band, ring in enumerate(rings):
+                area = areas[band][index]
+                if area is None or area.is_empty:
+                    continue
+                geometry = QgsGeometry()
+                geometry.fromWkb(shapely.to_wkb(area))
+                out_feat = QgsFeature(area_fields)
+                out_feat.setGeometry(geometry)
+                out_feat.setAttributes(market.attributes() + [
+                    ring, int(counts[band][index]), float(band_loads[band][index])])
+                area_sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+        feedback.setProgress(80)
+
+        assignment_fields = cooperatives.fields()
+        assignment_fields.append(QgsField('market_fid', QVariant.LongLong))
+        assignment_fields.append(QgsField('market_distance', QVariant.Double))
+        assignment_fields.append(QgsField('market_ring', QVariant.Double))
+
+        (assignment_sink, assignment_dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT_ASSIGNMENTS,
+            context,
+            assignment_fields,
+            cooperatives.wkbType(),
+            crs
+        )
+        if assignment_sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT_ASSIGNMENTS))
+
+        for feature in cooperatives.getFeatures():
+            if feedback.isCanceled():
+                break
+            row = rows.get(feature.id())
+            if row is None or nearest[row] < 0:
+                values = [None, None, None]
+            else:
+                distance = float(distances[row])
+                ring = next((ring for ring in rings if distance <= ring), None)
+                values = [market_features[nearest[row]].id(), distance, ring]
+            feature.setAttributes(feature.attributes() + values)
+            assignment_sink.addFeature(feature, QgsFeatureSink.FastInsert)
+
+        return {
+            self.OUTPUT_AREAS: area_dest_id,
+            self.OUTPUT_ASSIGNMENTS: assignment_dest_id
+        }
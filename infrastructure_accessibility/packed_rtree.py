@@ -0,0 +1,331 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Disk-backed packed R-tree for road layers larger than memory.
+
+Road segments are streamed once: their WKB goes to a data file and their
+bounding boxes, keyed by the Hilbert value of their centre, are sorted
+externally in runs bounded by the memory budget. The sorted boxes become
+the leaves of a packed R-tree written bottom-up to a tree file. Both
+files are memory-mapped for queries, so only the pages touched by a
+search are read, and decoded segments are kept in a byte-bounded cache.
+
+Memory is accounted with measured sizes of the Python objects involved,
+not with the size of the packed bytes on disk.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+# Entries of every tree level: bbox, then (data offset, WKB length) for
+# leaves or (first child index, child count) for internal nodes
+ENTRY = struct.Struct('<4dQQ')
+# Sort records: Hilbert value, bbox, data offset, WKB length
+RECORD = struct.Struct('<Q4dQQ')
+FOOTER = struct.Struct('<QQ')
+
+NODE_SIZE = 16
+HILBERT_ORDER = 16
+
+# Records read at once from every sort run while merging, at most
+READ_CHUNK = 1024
+
+# Estimated memory of an open sort run while merging, besides its read
+# chunk: the unbuffered file object, its generator and its heap entry
+RUN_OVERHEAD = 1024
+
+# Estimated memory of a decoded segment beyond its WKB length: the
+# geometry objects, their Python wrapper and the cache entry. The decoded
+# vertex arrays take about as much as the WKB coordinates.
+SEGMENT_OVERHEAD = 640
+
+
+def _record_memory():
+    """
+    Returns the memory taken by one sort record held in a list: the
+    tuple, its values (with the largest Hilbert values and offsets) and
+    the list slot, plus its share of list growth and of the sort buffer.
+    """
+    sample = ((1 << (2 * HILBERT_ORDER)) - 1, 0.5, 0.5, 0.5, 0.5, 1 << 40, 1 << 40)
+    return sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample) + 16
+
+
+RECORD_MEMORY = _record_memory()
+
+
+def hilbert_value(x, y, extent, order=HILBERT_ORDER):
+    """
+    Returns the position of a point along a Hilbert curve covering the
+    extent (xmin, ymin, xmax, ymax).
+    """
+    side = (1 << order) - 1
+    width = (extent[2] - extent[0]) or 1.0
+    height = (extent[3] - extent[1]) or 1.0
+    hx = min(side, max(0, int(side * (x - extent[0]) / width)))
+    hy = min(side, max(0, int(side * (y - extent[1]) / height)))
+
+    value = 0
+    s = 1 << (order - 1)
+    while s > 0:
+        rx = 1 if hx & s else 0
+        ry = 1 if hy & s else 0
+        value += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                hx = side - hx
+                hy = side - hy
+            hx, hy = hy, hx
+        s >>= 1
+    return value
+
+
+def _write_run(records, directory, index):
+    records.sort()
+    path = os.path.join(directory, 'run_{}.bin'.format(index))
+    with open(path, 'wb') as run:
+        for record in records:
+            run.write(RECORD.pack(*record))
+    return path
+
+
+def _merge_memory(runs, chunk_records):
+    return runs * (chunk_records * RECORD.size + RECORD_MEMORY + RUN_OVERHEAD)
+
+
+def _chunk_records(budget, runs):
+    """
+    Returns how many records every open run may read at once so that
+    merging that many runs keeps within budget.
+    """
+    per_run = budget // runs - RECORD_MEMORY - RUN_OVERHEAD
+    return max(1, min(READ_CHUNK, per_run // RECORD.size))
+
+
+def _merge_runs(paths, directory, index, chunk_records):
+    """
+    Merges sorted runs into a single new run and removes them.
+    """
+    path = os.path.join(directory, 'run_{}.bin'.format(index))
+    with open(path, 'wb') as run:
+        for record in heapq.merge(*(_read_run(run_path, chunk_records) for run_path in paths)):
+            run.write(RECORD.pack(*record))
+    for run_path in paths:
+        os.remove(run_path)
+    return path
+
+
+def _read_run(path, chunk_records):
+    with open(path, 'rb', buffering=0) as run:
+        while True:
+            chunk = run.read(RECORD.size * chunk_records)
+            if not chunk:
+                break
+            for record in RECORD.iter_unpack(chunk):
+                yield record
+
+
+class PackedRTree:
+    """
+    Packed R-tree over memory-mapped segment bounding boxes.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._tree_file = open(os.path.join(directory, 'tree.bin'), 'rb')
+        self._data_file = open(os.path.join(directory, 'segments.bin'), 'rb')
+        self.tree = mmap.mmap(self._tree_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = None
+        if os.path.getsize(self._data_file.name):
+            self.data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer_offset, level_count = FOOTER.unpack_from(self.tree, len(self.tree) - FOOTER.size)
+        # (offset, entry count) of every level, leaves first
+        self.levels = [
+            FOOTER.unpack_from(self.tree, footer_offset + index * FOOTER.size)
+            for index in range(level_count)
+        ]
+
+    @classmethod
+    def build(cls, segments, extent, directory, sort_budget):
+        """
+        Builds the tree files in directory from an iterable of (bbox, wkb)
+        segments, where bbox is (xmin, ymin, xmax, ymax) inside extent.
+        The external sort keeps within sort_budget bytes, besides a few
+        kilobytes of fixed overhead and the list of run files, except that
+        a run always holds at least one node of records.
+        Returns the tree, the number of sort runs and the peak memory of
+        the sort in bytes.
+        """
+        capacity = max(NODE_SIZE, sort_budget // RECORD_MEMORY)
+        peak = 0
+        runs = []
+        records = []
+        offset = 0
+        with open(os.path.join(directory, 'segments.bin'), 'wb') as data:
+            for bbox, wkb in segments:
+                data.write(wkb)
+                centre_x = (bbox[0] + bbox[2]) / 2
+                centre_y = (bbox[1] + bbox[3]) / 2
+                records.append((hilbert_value(centre_x, centre_y, extent),) + tuple(bbox) + (offset, len(wkb)))
+                offset += len(wkb)
+                if len(records) >= capacity:
+                    peak = max(peak, len(records) * RECORD_MEMORY)
+                    runs.append(_write_run(records, directory, len(runs)))
+                    records = []
+        if records or not runs:
+            peak = max(peak, len(records) * RECORD_MEMORY)
+            runs.append(_write_run(records, directory, len(runs)))
+        records = None
+        sort_runs = run_index = len(runs)
+
+        # Merge in several passes when the budget cannot hold every run open
+        fan_in = max(2, sort_budget // _merge_memory(1, 1))
+        while len(runs) > fan_in:
+            merged = []
+            for first in range(0, len(runs), fan_in):
+                group = runs[first:first + fan_in]
+                if len(group) == 1:
+                    merged.extend(group)
+                    continue
+                chunk_records = _chunk_records(sort_budget, len(group))
+                peak = max(peak, _merge_memory(len(group), chunk_records))
+                merged.append(_merge_runs(group, directory, run_index, chunk_records))
+                run_index += 1
+            runs = merged
+        chunk_records = _chunk_records(sort_budget, len(runs))
+        peak = max(peak, _merge_memory(len(runs), chunk_records))
+
+        levels = []
+        with open(os.path.join(directory, 'tree.bin'), 'wb') as tree:
+            # Leaves, merged from the sorted runs
+            count = 0
+            for record in heapq.merge(*(_read_run(run, chunk_records) for run in runs)):
+                tree.write(ENTRY.pack(*record[1:]))
+                count += 1
+            levels.append((0, count))
+            for run in runs:
+                os.remove(run)
+
+            # Internal levels, each built by streaming over the level below
+            while levels[-1][1] > 1:
+                tree.flush()
+                child_offset, child_count = levels[-1]
+                level_offset = tree.tell()
+                with open(tree.name, 'rb') as below:
+                    below.seek(child_offset)
+                    for first in range(0, child_count, NODE_SIZE):
+                        size = min(NODE_SIZE, child_count - first)
+                        children = list(ENTRY.iter_unpack(below.read(ENTRY.size * size)))
+                        tree.write(ENTRY.pack(
+                            min(child[0] for child in children),
+                            min(child[1] for child in children),
+                            max(child[2] for child in children),
+                            max(child[3] for child in children),
+                            first,
+                            size
+                        ))
+                levels.append((level_offset, (child_count + NODE_SIZE - 1) // NODE_SIZE))
+
+            footer_offset = tree.tell()
+            for level in levels:
+                tree.write(FOOTER.pack(*level))
+            tree.write(FOOTER.pack(footer_offset, len(levels)))
+
+        return cls(directory), sort_runs, peak
+
+    def __len__(self):
+        return self.levels[0][1]
+
+    def _entry(self, level, index):
+        return ENTRY.unpack_from(self.tree, self.levels[level][0] + index * ENTRY.size)
+
+    def search(self, xmin, ymin, xmax, ymax):
+        """
+        Returns the (offset, length) of every segment whose bounding box
+        intersects the rectangle.
+        """
+        if not len(self):
+            return []
+        found = []
+        top = len(self.levels) - 1
+        stack = [(top, index) for index in range(self.levels[top][1])]
+        while stack:
+            level, index = stack.pop()
+            entry = self._entry(level, index)
+            if entry[0] > xmax or entry[2] < xmin or entry[1] > ymax or entry[3] < ymin:
+                continue
+            if level == 0:
+                found.append((entry[4], entry[5]))
+            else:
+                stack.extend((level - 1, child) for child in range(entry[4], entry[4] + entry[5]))
+        return found
+
+    def wkb(self, offset, length):
+        """
+        Returns the WKB of a segment.
+        """
+        return self.data[offset:offset + length]
+
+    def close(self):
+        """
+        Releases the memory maps and files.
+        """
+        self.tree.close()
+        if self.data is not None:
+            self.data.close()
+        self._tree_file.close()
+        self._data_file.close()
+
+
+class SegmentCache:
+    """
+    Least recently used cache of decoded segments, bounded by their
+    estimated memory: the WKB length plus a fixed overhead per segment.
+    """
+
+    def __init__(self, tree, budget, decode, overhead=SEGMENT_OVERHEAD):
+        self.tree = tree
+        self.budget = budget
+        self.decode = decode
+        self.overhead = overhead
+        self.segments = OrderedDict()
+        self.size = 0
+        self.peak = 0
+        self.loads = 0
+
+    def get(self, offset, length):
+        """
+        Returns a decoded segment, paging it in from disk when needed.
+        Segments larger than the whole budget are decoded but not cached.
+        """
+        cached = self.segments.get(offset)
+        if cached is not None:
+            self.segments.move_to_end(offset)
+            return cached[0]
+
+        size = length + self.overhead
+        cacheable = size <= self.budget
+        if cacheable:
+            # Evict before decoding, so memory never goes over the budget
+            while self.size + size > self.budget:
+                _, (_, evicted_size) = self.segments.popitem(last=False)
+                self.size -= evicted_size
+
+        segment = self.decode(self.tree.wkb(offset, length))
+        self.loads += 1
+        if cacheable:
+            self.segments[offset] = (segment, size)
+            self.size += size
+            self.peak = max(self.peak, self.size)
+        return segment
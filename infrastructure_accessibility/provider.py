@@ -0,0 +1,56 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Processing provider of the plugin.
+
+This module is what QGIS imports at startup, so it only depends on
+qgis.core. The algorithm modules are imported when Processing asks the
+provider for its algorithms, and they in turn defer Processing, the
+database, indexing and NumPy based backends to their first run.
+"""
+
+from qgis.core import QgsProcessingProvider
+
+
+class InfrastructureAccessibilityProvider(QgsProcessingProvider):
+    def loadAlgorithms(self):
+        from .infrastructure_accessibility_algorithm import InfrastructureAccessibilityAlgorithm
+        from .geoparquet_accessibility_algorithm import GeoParquetAccessibilityAlgorithm
+        from .market_catchment_algorithm import MarketCatchmentAlgorithm
+        from .sensitivity_analysis_algorithm import SensitivityAnalysisAlgorithm
+        from .temporal_accessibility_algorithm import TemporalAccessibilityAlgorithm
+
+        self.addAlgorithm(InfrastructureAccessibilityAlgorithm())
+        self.addAlgorithm(GeoParquetAccessibilityAlgorithm())
+        self.addAlgorithm(MarketCatchmentAlgorithm())
+        self.addAlgorithm(SensitivityAnalysisAlgorithm())
+        self.addAlgorithm(TemporalAccessibilityAlgorithm())
+
+    def id(self):
+        return 'infrastructureaccessibility'
+
+    def name(self):
+        return self.tr('Infrastructure Accessibility')
+
+    def icon(self):
+        return QgsProcessingProvider.icon(self)
+
+    def longName(self):
+        return self.name()
+
+    def initGui(self):
+        """Initialize the GUI elements"""
+        # For Processing providers, we don't need to do anything here
+        pass
+
+    def unload(self):
+        """Unload the provider"""
+        # For Processing providers, we don't need to do anything here
+        pass
@@ -0,0 +1,323 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Database pushdown for accessibility scoring.
+
+When the cooperatives, roads and markets layers all live in the same
+PostGIS, SpatiaLite or GeoPackage database the nearest road and market
+distances are computed by a single set-based SQL query that uses the
+database's spatial indexes, instead of pulling every geometry through
+getFeatures(). Pushdown is only used when the layers share a CRS and the
+road and market tables have a spatial index; otherwise the caller falls
+back to the buffer analysis.
+
+qgis.core is imported by the functions that talk to QGIS, so the SQL can
+be built and tested without it.
+"""
+
+from collections import namedtuple
+
+from .scoring import ring_distances, ring_score
+
+POSTGIS = 'postgres'
+SPATIALITE = 'spatialite'
+GEOPACKAGE = 'ogr'
+
+DatabaseTable = namedtuple(
+    'DatabaseTable',
+    ['provider', 'connection', 'schema', 'table', 'geometry_column', 'key_column']
+)
+
+
+def quote_identifier(name):
+    """
+    Returns a double-quoted SQL identifier.
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def quote_literal(value):
+    """
+    Returns a single-quoted SQL string literal.
+    """
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def database_table(layer):
+    """
+    Returns the DatabaseTable a layer is read from, or None when the
+    layer does not come from a supported database.
+    """
+    from qgis.core import QgsDataSourceUri, QgsProviderRegistry
+
+    provider = layer.providerType()
+    if provider == POSTGIS:
+        uri = QgsDataSourceUri(layer.source())
+        if not uri.table() or uri.sql() or not uri.keyColumn() or ',' in uri.keyColumn():
+            return None
+        return DatabaseTable(
+            POSTGIS, uri.connectionInfo(False), uri.schema() or 'public',
+            uri.table(), uri.geometryColumn(), uri.keyColumn()
+        )
+    if provider == SPATIALITE:
+        uri = QgsDataSourceUri(layer.source())
+        if not uri.table() or uri.sql():
+            return None
+        return DatabaseTable(
+            SPATIALITE, uri.database(), None, uri.table(),
+            uri.geometryColumn(), uri.keyColumn() or 'ROWID'
+        )
+    if provider == GEOPACKAGE:
+        parts = QgsProviderRegistry.instance().decodeUri(provider, layer.source())
+        path = parts.get('path', '')
+        if not path.lower().endswith('.gpkg') or parts.get('subset'):
+            return None
+        # The geometry column is looked up once the connection is open
+        return DatabaseTable(
+            GEOPACKAGE, path, None, parts.get('layerName') or layer.name(),
+            None, 'ROWID'
+        )
+    return None
+
+
+def shared_database(*layers):
+    """
+    Returns the DatabaseTable of every layer when they all live in the
+    same database and share a CRS, or None otherwise.
+    """
+    # Distances between different CRSs are meaningless, and PostGIS
+    # refuses to compare geometries with different SRIDs
+    if any(layer.crs() != layers[0].crs() for layer in layers[1:]):
+        return None
+    tables = [database_table(layer) for layer in layers]
+    if any(table is None for table in tables):
+        return None
+    if len({(table.provider, table.connection) for table in tables}) != 1:
+        return None
+    return tables
+
+
+def _connection(table):
+    from qgis.core import QgsProviderRegistry
+
+    metadata = QgsProviderRegistry.instance().providerMetadata(table.provider)
+    return metadata.createConnection(table.connection, {})
+
+
+def _stream_sql(connection, sql):
+    """
+    Yields the rows of a query, streaming them where the QGIS version
+    supports it.
+    """
+    if hasattr(connection, 'execSql'):
+        result = connection.execSql(sql)
+        while result.hasNextRow():
+            yield result.nextRow()
+    else:
+        for row in connection.executeSql(sql):
+            yield row
+
+
+def _resolve_geopackage_columns(execute, tables):
+    resolved = []
+    for table in tables:
+        if table.geometry_column is None:
+            rows = execute(
+                'SELECT column_name FROM gpkg_geometry_columns '
+                'WHERE table_name = {}'.format(quote_literal(table.table))
+            )
+            if not rows:
+                return None
+            table = table._replace(geometry_column=rows[0][0])
+        resolved.append(table)
+    return resolved
+
+
+def has_spatial_index(execute, table):
+    """
+    Returns whether the spatial index the score query relies on exists for
+    a table. execute runs a query and returns its rows. Without an index
+    the SpatiaLite SpatialIndex table returns no rows and the GeoPackage
+    rtree table does not exist, so the query cannot run.
+    """
+    if table.provider == SPATIALITE:
+        rows = execute(
+            'SELECT spatial_index_enabled FROM geometry_columns '
+            'WHERE lower(f_table_name) = lower({}) AND lower(f_geometry_column) = lower({})'.format(
+                quote_literal(table.table), quote_literal(table.geometry_column))
+        )
+        # 1 is an R*Tree index, 2 an MBR cache which SpatialIndex cannot use
+        return bool(rows) and int(rows[0][0]) == 1
+    if table.provider == GEOPACKAGE:
+        rows = execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND lower(name) = lower({})".format(
+                quote_literal('rtree_{}_{}'.format(table.table, table.geometry_column)))
+        )
+        return bool(rows) and int(rows[0][0]) > 0
+    # PostGIS runs the query with or without an index
+    return True
+
+
+def prepare_tables(tables, feedback=None):
+    """
+    Checks that the score query can run in the shared database and returns
+    the tables ready for pushdown_scores, with the GeoPackage geometry
+    columns resolved. Returns None, and reports why to feedback, when the
+    database cannot be opened, a geometry column is unknown, or the road
+    or market table has no spatial index.
+    """
+    from qgis.core import QgsProviderConnectionException
+
+    def report(message):
+        if feedback is not None:
+            feedback.pushInfo(message)
+
+    try:
+        connection = _connection(tables[0])
+        if tables[0].provider == GEOPACKAGE:
+            tables = _resolve_geopackage_columns(connection.executeSql, tables)
+            if tables is None:
+                report('Could not read the geometry columns of the GeoPackage tables')
+                return None
+        for table in tables[1:]:
+            if not has_spatial_index(connection.executeSql, table):
+                report('Table {} has no spatial index'.format(table.table))
+                return None
+    except QgsProviderConnectionException as e:
+        report('Could not query the database: {}'.format(e))
+        return None
+    return tables
+
+
+def _table_name(table):
+    if table.schema:
+        return '{}.{}'.format(quote_identifier(table.schema), quote_identifier(table.table))
+    return quote_identifier(table.table)
+
+
+def _score_case(distance_expression, buffer_distance):
+    """
+    Returns a CASE expression scoring a distance by its innermost ring.
+    """
+    whens = ' '.join(
+        'WHEN {} <= {!r} THEN {!r}'.format(distance_expression, float(ring), float(ring_score(ring)))
+        for ring in ring_distances(buffer_distance)
+    )
+    return 'CASE WHEN {} IS NULL THEN 0 {} ELSE 0 END'.format(distance_expression, whens)
+
+
+def _postgis_nearest(cooperative, target, alias, search_distance):
+    coop_geom = 'c.{}'.format(quote_identifier(cooperative.geometry_column))
+    target_geom = '{}.{}'.format(alias, quote_identifier(target.geometry_column))
+    return (
+        'LEFT JOIN LATERAL ('
+        'SELECT ST_Distance({coop}, {target}) AS distance '
+        'FROM {table} AS {alias} '
+        'WHERE ST_DWithin({coop}, {target}, {search!r}) '
+        'ORDER BY {coop} <-> {target} LIMIT 1'
+        ') AS {alias}_nearest ON TRUE'
+    ).format(
+        coop=coop_geom, target=target_geom, table=_table_name(target),
+        alias=alias, search=float(search_distance)
+    )
+
+
+def _sqlite_candidates(dialect, cooperative, target, alias, search_distance):
+    coop_geom = 'c.{}'.format(quote_identifier(cooperative.geometry_column))
+    if dialect == SPATIALITE:
+        return (
+            '{alias}.ROWID IN (SELECT ROWID FROM SpatialIndex '
+            'WHERE f_table_name = {table} AND f_geometry_column = {column} '
+            'AND search_frame = BuildMbr(MbrMinX({coop}) - {d!r}, MbrMinY({coop}) - {d!r}, '
+            'MbrMaxX({coop}) + {d!r}, MbrMaxY({coop}) + {d!r}))'
+        ).format(
+            alias=alias, table=quote_literal(target.table),
+            column=quote_literal(target.geometry_column), coop=coop_geom,
+            d=float(search_distance)
+        )
+    rtree = quote_identifier('rtree_{}_{}'.format(target.table, target.geometry_column))
+    return (
+        '{alias}.ROWID IN (SELECT id FROM {rtree} '
+        'WHERE minx <= ST_MaxX({coop}) + {d!r} AND maxx >= ST_MinX({coop}) - {d!r} '
+        'AND miny <= ST_MaxY({coop}) + {d!r} AND maxy >= ST_MinY({coop}) - {d!r})'
+    ).format(alias=alias, rtree=rtree, coop=coop_geom, d=float(search_distance))
+
+
+def _sqlite_nearest(dialect, cooperative, target, alias, search_distance):
+    return (
+        '(SELECT MIN(ST_Distance(c.{coop}, {alias}.{target})) FROM {table} AS {alias} '
+        'WHERE {candidates})'
+    ).format(
+        coop=quote_identifier(cooperative.geometry_column), alias=alias,
+        target=quote_identifier(target.geometry_column), table=_table_name(target),
+        candidates=_sqlite_candidates(dialect, cooperative, target, alias, search_distance)
+    )
+
+
+def build_score_query(tables, road_distance, market_distance):
+    """
+    Returns the SQL computing the nearest road and market distances and
+    their ring scores for every cooperative. The result columns are
+    coop_id, road_distance, market_distance, road_score and market_score.
+
+    The search is limited to the outermost ring so the spatial indexes
+    only return candidates that can contribute to a score.
+    """
+    cooperatives, roads, markets = tables
+    dialect = cooperatives.provider
+    road_search = ring_distances(road_distance)[-1]
+    market_search = ring_distances(market_distance)[-1]
+    key = 'c.{}'.format(quote_identifier(cooperatives.key_column))
+
+    if dialect == POSTGIS:
+        return (
+            'SELECT {key} AS coop_id, r_nearest.distance AS road_distance, '
+            'm_nearest.distance AS market_distance, '
+            '{road_score} AS road_score, {market_score} AS market_score '
+            'FROM {coops} AS c {road_join} {market_join}'
+        ).format(
+            key=key, coops=_table_name(cooperatives),
+            road_score=_score_case('r_nearest.distance', road_distance),
+            market_score=_score_case('m_nearest.distance', market_distance),
+            road_join=_postgis_nearest(cooperatives, roads, 'r', road_search),
+            market_join=_postgis_nearest(cooperatives, markets, 'm', market_search)
+        )
+
+    return (
+        'SELECT coop_id, road_distance, market_distance, '
+        '{road_score} AS road_score, {market_score} AS market_score '
+        'FROM (SELECT {key} AS coop_id, {road} AS road_distance, {market} AS market_distance '
+        'FROM {coops} AS c)'
+    ).format(
+        key=key, coops=_table_name(cooperatives),
+        road_score=_score_case('road_distance', road_distance),
+        market_score=_score_case('market_distance', market_distance),
+        road=_sqlite_nearest(dialect, cooperatives, roads, 'r', road_search),
+        market=_sqlite_nearest(dialect, cooperatives, markets, 'm', market_search)
+    )
+
+
+def pushdown_scores(tables, road_distance, market_distance, feedback=None):
+    """
+    Runs the score query in the shared database and returns a dictionary
+    mapping each cooperative key to its (road_score, market_score).
+    tables must come from prepare_tables.
+    """
+    connection = _connection(tables[0])
+    sql = build_score_query(tables, road_distance, market_distance)
+    if feedback is not None:
+        feedback.pushDebugInfo(sql)
+
+    scores = {}
+    for row in _stream_sql(connection, sql):
+        if feedback is not None and feedback.isCanceled():
+            break
+        scores[row[0]] = (float(row[3]), float(row[4]))
+    return scores
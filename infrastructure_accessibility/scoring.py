@@ -0,0 +1,48 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# Each buffer distance is expanded into three rings: d, 2d and 5d
+RING_MULTIPLIERS = (1, 2, 5)
+
+
+def ring_distances(buffer_distance):
+    """
+    Returns the ring distances used for a buffer distance, innermost first.
+    """
+    return [buffer_distance * multiplier for multiplier in RING_MULTIPLIERS]
+
+
+def ring_score(ring_distance):
+    """
+    Returns the score for a feature falling inside a ring.
+    """
+    return 100 - (ring_distance * 0.01)
+
+
+def band_score(distance, buffer_distance):
+    """
+    Returns the score for a feature at the given distance from the
+    nearest infrastructure, using the innermost ring that contains it.
+    A distance of None means no infrastructure was found.
+    """
+    if distance is None:
+        return 0
+    for ring_distance in ring_distances(buffer_distance):
+        if distance <= ring_distance:
+            return ring_score(ring_distance)
+    return 0
+
+
+def combined_score(road_score, market_score, road_weight):
+    """
+    Returns the weighted accessibility score.
+    """
+    return (road_score * road_weight) + (market_score * (1 - road_weight))
@@ -0,0 +1,164 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Monte-Carlo sensitivity of the accessibility scores to the road weight
+and the buffer distances.
+
+The geometry pass is done once: the exact nearest road and market
+distances of every cooperative. Every sampled combination of weight and
+distances is then only a ring lookup on those distances, so whole chunks
+of samples are evaluated as one (cooperatives x samples) matrix
+operation. Requires NumPy.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .engine import band_scores
+from .scoring import combined_score
+
+# Number of rank groups used for the rank stability
+RANK_GROUPS = 5
+
+SensitivitySummary = namedtuple(
+    'SensitivitySummary',
+    ['baseline_score', 'baseline_rank', 'score_mean', 'score_std',
+     'rank_mean', 'rank_std', 'rank_stability']
+)
+
+
+def sample_parameters(count, road_weight_range, road_distance_range, market_distance_range, seed=None):
+    """
+    Returns count uniformly sampled (road weight, road distance, market
+    distance) combinations as three arrays.
+    """
+    generator = np.random.default_rng(seed)
+    return (
+        generator.uniform(*road_weight_range, size=count),
+        generator.uniform(*road_distance_range, size=count),
+        generator.uniform(*market_distance_range, size=count),
+    )
+
+
+def scores_matrix(road_distances, market_distances, road_weights, road_buffers, market_buffers):
+    """
+    Returns the (cooperatives x samples) matrix of accessibility scores.
+    """
+    road_scores = band_scores(road_distances[:, None], road_buffers[None, :])
+    market_scores = band_scores(market_distances[:, None], market_buffers[None, :])
+    return combined_score(road_scores, market_scores, road_weights[None, :])
+
+
+def competition_ranks(scores):
+    """
+    Ranks every column of a score matrix, 1 being the best. Tied scores
+    share the best rank of their group, so equal scores never produce
+    spurious rank changes.
+    """
+    count = scores.shape[0]
+    order = np.argsort(-scores, axis=0, kind='stable')
+    ordered = np.take_along_axis(scores, order, axis=0)
+    positions = np.broadcast_to(np.arange(count)[:, None], scores.shape)
+    starts = np.ones(scores.shape, dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    ordered_ranks = np.maximum.accumulate(np.where(starts, positions, 0), axis=0) + 1
+    ranks = np.empty(scores.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, ordered_ranks, axis=0)
+    return ranks
+
+
+def rank_groups(ranks, count):
+    """
+    Returns the rank group (0 for the best fifth) of ranks among count
+    cooperatives.
+    """
+    return (ranks - 1) * RANK_GROUPS // max(count, 1)
+
+
+class _MomentAccumulator:
+    """
+    Per-row running mean and sum of squared deviations, merged chunk by
+    chunk with Chan's formula.
+    """
+
+    def __init__(self, rows):
+        self.count = 0
+        self.mean = np.zeros(rows)
+        self.m2 = np.zeros(rows)
+
+    def add_chunk(self, values):
+        count = values.shape[1]
+        mean = values.mean(axis=1)
+        m2 = ((values - mean[:, None]) ** 2).sum(axis=1)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else np.full(len(self.mean), np.nan)
+
+
+def analyse(road_distances, market_distances, samples, baseline, chunk_size=100, feedback=None):
+    """
+    Evaluates every sampled (road weight, road distance, market distance)
+    combination on precomputed nearest distances and returns a
+    SensitivitySummary of per-cooperative arrays.
+
+    samples is the tuple of three arrays returned by sample_parameters and
+    baseline a single (road weight, road distance, market distance) the
+    rank stability is measured against: the share of samples in which a
+    cooperative stays in its baseline rank group (fifths of the ranking).
+    At most chunk_size samples are held in memory at once.
+    """
+    road_distances = np.asarray(road_distances, dtype=float)
+    market_distances = np.asarray(market_distances, dtype=float)
+    road_weights, road_buffers, market_buffers = (np.asarray(values, dtype=float) for values in samples)
+    count = len(road_distances)
+
+    baseline_scores = scores_matrix(
+        road_distances, market_distances,
+        np.array([baseline[0]]), np.array([baseline[1]]), np.array([baseline[2]])
+    )
+    baseline_ranks = competition_ranks(baseline_scores)
+    baseline_groups = rank_groups(baseline_ranks[:, 0], count)
+
+    score_moments = _MomentAccumulator(count)
+    rank_moments = _MomentAccumulator(count)
+    stable = np.zeros(count, dtype=np.int64)
+
+    total = len(road_weights)
+    for start in range(0, total, chunk_size):
+        if feedback is not None:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int(100.0 * start / total))
+        chunk = slice(start, start + chunk_size)
+        scores = scores_matrix(
+            road_distances, market_distances,
+            road_weights[chunk], road_buffers[chunk], market_buffers[chunk]
+        )
+        ranks = competition_ranks(scores)
+        score_moments.add_chunk(scores)
+        rank_moments.add_chunk(ranks)
+        stable += (rank_groups(ranks, count) == baseline_groups[:, None]).sum(axis=1)
+
+    evaluated = max(score_moments.count, 1)
+    return SensitivitySummary(
+        baseline_score=baseline_scores[:, 0],
+        baseline_rank=baseline_ranks[:, 0],
+        score_mean=score_moments.mean,
+        score_std=score_moments.std(),
+        rank_mean=rank_moments.mean,
+        rank_std=rank_moments.std(),
+        rank_stability=stable / evaluated
+    )
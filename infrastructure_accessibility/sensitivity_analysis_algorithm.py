@@ -0,0 +1,294 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRange,
+    QgsProcessingParameterFeatureSink,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFeatureSink,
+    QgsProcessingException
+)
+
+
+class SensitivityAnalysisAlgorithm(QgsProcessingAlgorithm):
+    """
+    Sensitivity analysis of the accessibility scores.
+    Samples many combinations of road weight and buffer distances and
+    reports how much each cooperative's score and rank move.
+    """
+
+    # Constants used to refer to parameters and outputs
+    INPUT_COOPERATIVES = 'INPUT_COOPERATIVES'
+    INPUT_ROADS = 'INPUT_ROADS'
+    INPUT_MARKETS = 'INPUT_MARKETS'
+    ROAD_BUFFER_RANGE = 'ROAD_BUFFER_RANGE'
+    MARKET_BUFFER_RANGE = 'MARKET_BUFFER_RANGE'
+    ROAD_WEIGHT_RANGE = 'ROAD_WEIGHT_RANGE'
+    SAMPLES = 'SAMPLES'
+    SEED = 'SEED'
+    CHUNK_SIZE = 'CHUNK_SIZE'
+    OUTPUT = 'OUTPUT'
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return SensitivityAnalysisAlgorithm()
+
+    def name(self):
+        """
+        Returns the algorithm name.
+        """
+        return 'accessibilitysensitivity'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Accessibility Sensitivity Analysis')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('Infrastructure Analysis')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group.
+        """
+        return 'infrastructureanalysis'
+
+    def shortHelpString(self):
+        """
+        Returns a short helper string for the algorithm.
+        """
+        return self.tr('''
+        Measures how robust the accessibility scores and rankings are to the
+        choice of road weight and buffer distances.
+
+        Parameters:
+            - Cooperatives layer (point)
+            - Roads layer (line)
+            - Markets layer (point)
+            - Ranges of road buffer distance, market buffer distance and
+              road weight to sample uniformly
+            - Number of samples and random seed
+            - Chunk size: samples evaluated at once, bounds memory use
+
+        The nearest road and market distances are computed once; every
+        sample is then evaluated on them.
+
+        Outputs the cooperatives with the score and rank at the middle of
+        the ranges, the mean and standard deviation of score and rank over
+        the samples, and the rank stability: the share of samples in which
+        the cooperative stays in the same fifth of the ranking.
+        Requires the NumPy and Shapely 2 Python packages.
+        ''')
+
+    def initAlgorithm(self, config=None):
+        """
+        Define the inputs and outputs of the algorithm.
+        """
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_COOPERATIVES,
+                self.tr('Cooperatives Layer'),
+                [QgsProcessing.TypeVectorPoint]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_ROADS,
+                self.tr('Roads Layer'),
+                [QgsProcessing.TypeVectorLine]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_MARKETS,
+                self.tr('Markets Layer'),
+                [QgsProcessing.TypeVectorPoint]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterRange(
+                self.ROAD_BUFFER_RANGE,
+                self.tr('Road Buffer Distance Range (meters)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue='500,1500'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterRange(
+                self.MARKET_BUFFER_RANGE,
+                self.tr('Market Buffer Distance Range (meters)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue='1000,3000'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterRange(
+                self.ROAD_WEIGHT_RANGE,
+                self.tr('Road Accessibility Weight Range (0-1)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue='0.4,0.8'
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SAMPLES,
+                self.tr('Number of Samples'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1000,
+                minValue=1
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SEED,
+                self.tr('Random Seed'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CHUNK_SIZE,
+                self.tr('Samples Evaluated at Once'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=100,
+                minValue=1
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Sensitivity Results')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Process the algorithm.
+        """
+        try:
+            from . import engine, sensitivity
+        except ImportError as e:
+            raise QgsProcessingException(
+                self.tr('Sensitivity analysis requires NumPy and Shapely 2: {}').format(e))
+
+        cooperatives = self.parameterAsVectorLayer(parameters, self.INPUT_COOPERATIVES, context)
+        roads = self.parameterAsVectorLayer(parameters, self.INPUT_ROADS, context)
+        markets = self.parameterAsVectorLayer(parameters, self.INPUT_MARKETS, context)
+        road_range = self.parameterAsRange(parameters, self.ROAD_BUFFER_RANGE, context)
+        market_range = self.parameterAsRange(parameters, self.MARKET_BUFFER_RANGE, context)
+        weight_range = self.parameterAsRange(parameters, self.ROAD_WEIGHT_RANGE, context)
+        sample_count = self.parameterAsInt(parameters, self.SAMPLES, context)
+        seed = self.parameterAsInt(parameters, self.SEED, context)
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+
+        if not 0 <= weight_range[0] <= weight_range[1] <= 1:
+            raise QgsProcessingException(self.tr('The road weight range must lie within 0-1'))
+
+        # Geometry pass, done once for every sample
+        crs = cooperatives.sourceCrs()
+        request = QgsFeatureRequest().setDestinationCrs(crs, context.transformContext())
+
+        feedback.pushInfo('Computing nearest road and market distances...')
+        coop_ids, coop_geometries = engine.geometries_from_features(cooperatives.getFeatures())
+        _, road_geometries = engine.geometries_from_features(roads.getFeatures(request))
+        _, market_geometries = engine.geometries_from_features(markets.getFeatures(request))
+
+        if feedback.isCanceled():
+            return {}
+
+        road_distances = engine.DistanceIndex(road_geometries).nearest_distances(
+            coop_geometries, engine.search_distance(road_range[1]))
+        market_distances = engine.DistanceIndex(market_geometries).nearest_distances(
+            coop_geometries, engine.search_distance(market_range[1]))
+
+        if feedback.isCanceled():
+            return {}
+
+        # Scoring pass over all samples
+        feedback.pushInfo('Evaluating {} samples...'.format(sample_count))
+        samples = sensitivity.sample_parameters(sample_count, weight_range, road_range, market_range, seed)
+        baseline = (sum(weight_range) / 2, sum(road_range) / 2, sum(market_range) / 2)
+        summary = sensitivity.analyse(
+            road_distances, market_distances, samples, baseline, chunk_size, feedback)
+
+        if feedback.isCanceled():
+            return {}
+
+        fields = cooperatives.fields()
+        fields.append(QgsField('baseline_score', QVariant.Double))
+        fields.append(QgsField('baseline_rank', QVariant.Int))
+        fields.append(QgsField('score_mean', QVariant.Double))
+        fields.append(QgsField('score_std', QVariant.Double))
+        fields.append(QgsField('rank_mean', QVariant.Double))
+        fields.append(QgsField('rank_std', QVariant.Double))
+        fields.append(QgsField('rank_stability', QVariant.Double))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            cooperatives.wkbType(),
+            crs
+        )
+
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        # The output pass reads the cooperatives again, match them by feature id
+        rows = {fid: row for row, fid in enumerate(coop_ids)}
+
+        for feature in cooperatives.getFeatures():
+            if feedback.isCanceled():
+                break
+            row = rows.get(feature.id())
+            if row is None:
+                values = [None] * 7
+            else:
+                values = [
+                    float(summary.baseline_score[row]),
+                    int(summary.baseline_rank[row]),
+                    float(summary.score_mean[row]),
+                    float(summary.score_std[row]),
+                    float(summary.rank_mean[row]),
+                    float(summary.rank_std[row]),
+                    float(summary.rank_stability[row])
+                ]
+            feature.setAttributes(feature.attributes() + values)
+            sink.addFeature(feature, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,96 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Multi-temporal accessibility scoring.
+
+Scores the cooperatives against a series of road and market snapshots.
+The cooperative geometries are read once. Every snapshot is fingerprinted
+from the WKB of its geometries, and a snapshot identical to one already
+scored reuses its nearest distances instead of being indexed and queried
+again, so a year in which the roads or the markets did not change only
+costs reading it. Requires NumPy and Shapely 2.
+"""
+
+import hashlib
+
+from .engine import DistanceIndex, band_scores, geometries_from_wkb, search_distance
+from .scoring import combined_score
+
+
+def fingerprint(wkb_values):
+    """
+    Returns a digest of a set of geometries given as WKB. It does not
+    depend on the order of the features; missing geometries are ignored.
+    """
+    digests = sorted(hashlib.sha1(bytes(wkb)).digest() for wkb in wkb_values if wkb)
+    return hashlib.sha1(b''.join(digests)).hexdigest()
+
+
+class SnapshotDistances:
+    """
+    Nearest distances from fixed geometries to infrastructure snapshots,
+    cached by snapshot fingerprint.
+    """
+
+    def __init__(self, geometries, max_distance):
+        self.geometries = geometries
+        self.max_distance = max_distance
+        self.distances = {}
+
+    def get(self, wkb_values):
+        """
+        Returns the nearest distances to a snapshot given as WKB, NaN where
+        nothing lies within the maximum distance, and whether they were
+        reused from an identical snapshot.
+        """
+        key = fingerprint(wkb_values)
+        distances = self.distances.get(key)
+        if distances is not None:
+            return distances, True
+
+        distances = DistanceIndex(geometries_from_wkb(wkb_values)).nearest_distances(
+            self.geometries, self.max_distance)
+        self.distances[key] = distances
+        return distances, False
+
+
+class TemporalScorer:
+    """
+    Scores fixed cooperative geometries against road and market snapshots.
+    """
+
+    def __init__(self, coop_geometries, road_distance, market_distance, road_weight):
+        self.road_distance = road_distance
+        self.market_distance = market_distance
+        self.road_weight = road_weight
+        self.roads = SnapshotDistances(coop_geometries, search_distance(road_distance))
+        self.markets = SnapshotDistances(coop_geometries, search_distance(market_distance))
+
+    def score(self, road_wkb, market_wkb):
+        """
+        Returns the accessibility scores against one snapshot and whether
+        the road and market distances were reused.
+        """
+        road_distances, roads_reused = self.roads.get(road_wkb)
+        market_distances, markets_reused = self.markets.get(market_wkb)
+        scores = combined_score(
+            band_scores(road_distances, self.road_distance),
+            band_scores(market_distances, self.market_distance),
+            self.road_weight
+        )
+        return scores, roads_reused, markets_reused
+
+
+def score_deltas(scores):
+    """
+    Returns the change of score since the previous snapshot for every
+    snapshot after the first, given the scores of each snapshot.
+    """
+    return [current - previous for previous, current in zip(scores, scores[1:])]
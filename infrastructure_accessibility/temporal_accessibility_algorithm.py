@@ -0,0 +1,299 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import re
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsProcessingParameterFeatureSink,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFeatureSink,
+    QgsProcessingException
+)
+
+
+class TemporalAccessibilityAlgorithm(QgsProcessingAlgorithm):
+    """
+    Change of accessibility over time.
+    Scores the cooperatives against a series of road and market snapshots
+    and reports the score of every snapshot and its change.
+    """
+
+    # Constants used to refer to parameters and outputs
+    INPUT_COOPERATIVES = 'INPUT_COOPERATIVES'
+    INPUT_ROADS = 'INPUT_ROADS'
+    INPUT_MARKETS = 'INPUT_MARKETS'
+    SNAPSHOT_LABELS = 'SNAPSHOT_LABELS'
+    ROAD_BUFFER_DISTANCE = 'ROAD_BUFFER_DISTANCE'
+    MARKET_BUFFER_DISTANCE = 'MARKET_BUFFER_DISTANCE'
+    ROAD_WEIGHT = 'ROAD_WEIGHT'
+    OUTPUT = 'OUTPUT'
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return TemporalAccessibilityAlgorithm()
+
+    def name(self):
+        """
+        Returns the algorithm name.
+        """
+        return 'temporalaccessibility'
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr('Accessibility Change Over Time')
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr('Infrastructure Analysis')
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group.
+        """
+        return 'infrastructureanalysis'
+
+    def shortHelpString(self):
+        """
+        Returns a short helper string for the algorithm.
+        """
+        return self.tr('''
+        Scores the cooperatives against yearly (or any other) snapshots of
+        the roads and markets in a single run.
+
+        Parameters:
+            - Cooperatives layer (point)
+            - Road snapshots (line layers) and market snapshots (point
+              layers), paired in order: the first roads layer with the
+              first markets layer, and so on
+            - Snapshot labels: comma separated, one per snapshot, used in
+              the output field names (e.g. 2013,2014,2015). Defaults to
+              1, 2, 3...
+            - Road and market buffer distances and road weight, as in the
+              accessibility analysis
+
+        A snapshot whose roads or markets are identical to an earlier one
+        reuses its distances instead of being indexed again.
+
+        Outputs the cooperatives with a score_<label> field per snapshot
+        and a delta_<label> field per snapshot after the first, holding the
+        change of score since the previous snapshot.
+        Requires the NumPy and Shapely 2 Python packages.
+        ''')
+
+    def initAlgorithm(self, config=None):
+        """
+        Define the inputs and outputs of the algorithm.
+        """
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_COOPERATIVES,
+                self.tr('Cooperatives Layer'),
+                [QgsProcessing.TypeVectorPoint]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_ROADS,
+                self.tr('Road Snapshots'),
+                QgsProcessing.TypeVectorLine
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_MARKETS,
+                self.tr('Market Snapshots'),
+                QgsProcessing.TypeVectorPoint
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.SNAPSHOT_LABELS,
+                self.tr('Snapshot Labels (comma separated)'),
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ROAD_BUFFER_DISTANCE,
+                self.tr('Road Buffer Distance (meters)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1000,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MARKET_BUFFER_DISTANCE,
+                self.tr('Market Buffer Distance (meters)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=2000,
+                minValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ROAD_WEIGHT,
+                self.tr('Road Accessibility Weight (0-1)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.6,
+                minValue=0,
+                maxValue=1
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT,
+                self.tr('Accessibility Change')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Process the algorithm.
+        """
+        try:
+            from . import engine
+            from .temporal import TemporalScorer, score_deltas
+        except ImportError as e:
+            raise QgsProcessingException(
+                self.tr('Temporal analysis requires NumPy and Shapely 2: {}').format(e))
+
+        cooperatives = self.parameterAsVectorLayer(parameters, self.INPUT_COOPERATIVES, context)
+        road_snapshots = self.parameterAsLayerList(parameters, self.INPUT_ROADS, context)
+        market_snapshots = self.parameterAsLayerList(parameters, self.INPUT_MARKETS, context)
+        labels = self.parameterAsString(parameters, self.SNAPSHOT_LABELS, context)
+        road_distance = self.parameterAsInt(parameters, self.ROAD_BUFFER_DISTANCE, context)
+        market_distance = self.parameterAsInt(parameters, self.MARKET_BUFFER_DISTANCE, context)
+        road_weight = self.parameterAsDouble(parameters, self.ROAD_WEIGHT, context)
+
+        if len(road_snapshots) != len(market_snapshots):
+            raise QgsProcessingException(
+                self.tr('Got {} road snapshots and {} market snapshots, they must be paired').format(
+                    len(road_snapshots), len(market_snapshots)))
+        labels = self.snapshotLabels(labels, len(road_snapshots))
+        score_fields = ['score_{}'.format(label) for label in labels] + \
+            ['delta_{}'.format(label) for label in labels[1:]]
+        clashes = [name for name in score_fields if cooperatives.fields().lookupField(name) >= 0]
+        if clashes:
+            raise QgsProcessingException(
+                self.tr('The cooperatives layer already has fields named {}, choose other snapshot labels').format(
+                    ', '.join(clashes)))
+
+        # Work in the cooperatives CRS
+        crs = cooperatives.sourceCrs()
+        request = QgsFeatureRequest().setNoAttributes().setDestinationCrs(crs, context.transformContext())
+
+        # Cooperative side, done once for all snapshots
+        feedback.pushInfo('Reading cooperatives...')
+        coop_ids, coop_geometries = engine.geometries_from_features(cooperatives.getFeatures())
+        scorer = TemporalScorer(coop_geometries, road_distance, market_distance, road_weight)
+
+        scores = []
+        for index, label in enumerate(labels):
+            if feedback.isCanceled():
+                return {}
+
+            snapshot_scores, roads_reused, markets_reused = scorer.score(
+                self.snapshotWkb(road_snapshots[index], request),
+                self.snapshotWkb(market_snapshots[index], request)
+            )
+            scores.append(snapshot_scores)
+
+            feedback.pushInfo('Snapshot {}: roads {}, markets {}'.format(
+                label,
+                'unchanged, reused' if roads_reused else 'indexed',
+                'unchanged, reused' if markets_reused else 'indexed'
+            ))
+            feedback.setProgress(int(80.0 * (index + 1) / len(labels)))
+
+        # One array per output field, in the order of score_fields
+        columns = scores + score_deltas(scores)
+
+        fields = cooperatives.fields()
+        for name in score_fields:
+            fields.append(QgsField(name, QVariant.Double))
+
+        (sink, dest_id) = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            cooperatives.wkbType(),
+            crs
+        )
+
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        # The output pass reads the cooperatives again, match them by feature id
+        rows = {fid: row for row, fid in enumerate(coop_ids)}
+
+        for feature in cooperatives.getFeatures():
+            if feedback.isCanceled():
+                break
+            row = rows.get(feature.id())
+            if row is None:
+                values = [None] * len(score_fields)
+            else:
+                values = [float(column[row]) for column in columns]
+            feature.setAttributes(feature.attributes() + values)
+            sink.addFeature(feature, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
+
+    def snapshotLabels(self, labels, count):
+        """
+        Returns one field name safe label per snapshot.
+        """
+        if not labels.strip():
+            return [str(index + 1) for index in range(count)]
+
+        labels = [re.sub(r'\W+', '_', label.strip()) for label in labels.split(',')]
+        if len(labels) != count:
+            raise QgsProcessingException(
+                self.tr('Got {} snapshot labels for {} snapshots').format(len(labels), count))
+        if len(set(labels)) != len(labels) or not all(labels):
+            raise QgsProcessingException(self.tr('Snapshot labels must be unique and not empty'))
+        return labels
+
+    def snapshotWkb(self, layer, request):
+        """
+        Returns the WKB of the geometries of a snapshot layer, None for
+        features without a geometry.
+        """
+        return [
+            bytes(feature.geometry().asWkb()) if feature.hasGeometry() else None
+            for feature in layer.getFeatures(request)
+        ]
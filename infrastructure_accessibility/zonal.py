@@ -0,0 +1,176 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Zonal accessibility statistics.
+
+Scored cooperatives are assigned to zone polygons through a spatial index
+and folded into per-zone accumulators as they are written, in a single
+streaming pass. The accumulators are mergeable, so chunks scored
+separately or in parallel can be combined.
+"""
+
+import math
+from collections import Counter
+
+# Percentiles reported for every zone
+ZONE_PERCENTILES = (10, 50, 90)
+
+
+class ScoreAccumulator:
+    """
+    Online, mergeable statistics of a stream of scores.
+
+    Mean and variance use Welford's algorithm, merged with Chan's
+    formula. Percentiles come from a histogram of the distinct scores,
+    which is exact and stays small because the ring bands only produce a
+    handful of distinct scores.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.histogram = Counter()
+
+    def add(self, value):
+        """
+        Adds one score.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self.histogram[value] += 1
+
+    def merge(self, other):
+        """
+        Adds every score of another accumulator.
+        """
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            self.histogram = Counter(other.histogram)
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram.update(other.histogram)
+
+    def std(self):
+        """
+        Returns the population standard deviation, or None when empty.
+        """
+        if not self.count:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile with linear interpolation between
+        ranks, or None when empty.
+        """
+        if not self.count:
+            return None
+        rank = (q / 100.0) * (self.count - 1)
+        lower_rank = math.floor(rank)
+        lower = upper = None
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if lower is None and seen > lower_rank:
+                lower = value
+            if seen > lower_rank + 1 or seen == self.count:
+                upper = value
+                break
+        return lower + (upper - lower) * (rank - lower_rank)
+
+
+class ZoneStatistics:
+    """
+    Assigns scored geometries to zone polygons and accumulates their
+    scores per zone.
+    """
+
+    def __init__(self, zones, crs, transform_context, feedback=None):
+        # Imported here so that ScoreAccumulator does not need QGIS
+        from qgis.core import QgsCoordinateTransform, QgsGeometry, QgsSpatialIndex
+
+        transform = QgsCoordinateTransform(zones.sourceCrs(), crs, transform_context)
+        self.index = QgsSpatialIndex()
+        self.engines = {}
+        for zone in zones.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                break
+            if not zone.hasGeometry():
+                continue
+            geometry = QgsGeometry(zone.geometry())
+            geometry.transform(transform)
+            engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+            engine.prepareGeometry()
+            self.engines[zone.id()] = (geometry, engine)
+            self.index.addFeature(zone.id(), geometry.boundingBox())
+        self.accumulators = {}
+
+    def zone_for(self, geometry):
+        """
+        Returns the id of the zone containing a geometry, or None. Points
+        on a shared boundary go to the zone with the lowest id.
+        """
+        for zone_id in sorted(self.index.intersects(geometry.boundingBox())):
+            if self.engines[zone_id][1].intersects(geometry.constGet()):
+                return zone_id
+        return None
+
+    def add(self, geometry, score):
+        """
+        Adds a scored geometry to the statistics of its zone.
+        """
+        if geometry.isNull():
+            return
+        zone_id = self.zone_for(geometry)
+        if zone_id is None:
+            return
+        if zone_id not in self.accumulators:
+            self.accumulators[zone_id] = ScoreAccumulator()
+        self.accumulators[zone_id].add(score)
+
+    def merge(self, other):
+        """
+        Adds the statistics gathered by another ZoneStatistics over the
+        same zones.
+        """
+        for zone_id, accumulator in other.accumulators.items():
+            if zone_id not in self.accumulators:
+                self.accumulators[zone_id] = ScoreAccumulator()
+            self.accumulators[zone_id].merge(accumulator)
+
+    def values(self, zone_id):
+        """
+        Returns the statistic values of a zone in the order of the zone
+        output fields: count, mean, min, max, std and the percentiles.
+        """
+        accumulator = self.accumulators.get(zone_id, ScoreAccumulator())
+        values = [accumulator.count]
+        if accumulator.count:
+            values += [accumulator.mean, accumulator.minimum, accumulator.maximum, accumulator.std()]
+        else:
+            values += [None, None, None, None]
+        values += [accumulator.percentile(q) for q in ZONE_PERCENTILES]
+        return values
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# Make the plugin package importable from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+# (case, engine, seconds, diverging cooperatives) recorded by the scoring
+# engine equivalence tests; diverging is None for the reference
+_ENGINE_RESULTS = []
+
+
+@pytest.fixture(scope='session')
+def engine_results():
+    return _ENGINE_RESULTS
+
+
+def _engine_table(terminalreporter, title, cells):
+    cases = list(dict.fromkeys(case for case, _, _, _ in _ENGINE_RESULTS))
+    engines = list(dict.fromkeys(engine for _, engine, _, _ in _ENGINE_RESULTS))
+    case_width = max(len(case) for case in cases)
+    widths = [max(10, len(engine)) for engine in engines]
+    terminalreporter.section(title)
+    terminalreporter.write_line(' '.join(
+        [''.ljust(case_width)] + [engine.rjust(width) for engine, width in zip(engines, widths)]))
+    for case in cases:
+        terminalreporter.write_line(' '.join([case.ljust(case_width)] + [
+            cells.get((case, engine), '-').rjust(width) for engine, width in zip(engines, widths)
+        ]))
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    Reports the scoring engine timings and the cooperatives they score
+    by the innermost ring where the original buffer loop does not.
+    """
+    if not _ENGINE_RESULTS:
+        return
+    _engine_table(terminalreporter, 'scoring engine timings (s)', {
+        (case, engine): '{:.3f}'.format(seconds) for case, engine, seconds, _ in _ENGINE_RESULTS})
+    _engine_table(terminalreporter, 'cooperatives scored by the innermost ring instead of the first buffer', {
+        (case, engine): str(diverging) for case, engine, _, diverging in _ENGINE_RESULTS if diverging is not None})
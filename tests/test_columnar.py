@@ -0,0 +1,165 @@
+"""
+Tests of the GeoParquet scoring pipeline against brute force distances.
+"""
+
+import json
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+shapely = pytest.importorskip('shapely', minversion='2.0')
+
+from shapely.geometry import LineString, Point  # noqa: E402
+
+from infrastructure_accessibility.columnar import score_geoparquet  # noqa: E402
+from infrastructure_accessibility.scoring import band_score, combined_score  # noqa: E402
+
+ROAD_DISTANCE = 100
+MARKET_DISTANCE = 200
+ROAD_WEIGHT = 0.6
+
+CRS = {'id': {'authority': 'EPSG', 'code': 32736}}
+
+
+def _layers(seed=5):
+    """
+    Random cooperatives, roads and markets, with a cooperative without a
+    geometry and cooperatives exactly on ring distances of a market.
+    """
+    rng = random.Random(seed)
+    coops = [Point(rng.uniform(0, 3000), rng.uniform(0, 3000)) for _ in range(80)]
+    roads = []
+    for _ in range(8):
+        x, y = rng.uniform(0, 3000), rng.uniform(0, 3000)
+        roads.append(LineString([(x, y), (x + rng.uniform(-800, 800), y + rng.uniform(-800, 800)),
+                                 (x + rng.uniform(-800, 800), y + rng.uniform(-800, 800))]))
+    markets = [Point(rng.uniform(0, 3000), rng.uniform(0, 3000)) for _ in range(5)]
+    for ring in (MARKET_DISTANCE, 2 * MARKET_DISTANCE, 5 * MARKET_DISTANCE):
+        coops.append(Point(markets[0].x + ring, markets[0].y))
+    coops[3] = None
+    return coops, roads, markets
+
+
+def _expected(coops, roads, markets):
+    expected = []
+    for coop in coops:
+        if coop is None:
+            expected.append(0.0)
+            continue
+        expected.append(combined_score(
+            band_score(min(coop.distance(road) for road in roads), ROAD_DISTANCE),
+            band_score(min(coop.distance(market) for market in markets), MARKET_DISTANCE),
+            ROAD_WEIGHT
+        ))
+    return expected
+
+
+def _coordinates_type(interleaved):
+    if interleaved:
+        return pa.list_(pa.float64(), 2)
+    return pa.struct([('x', pa.float64()), ('y', pa.float64())])
+
+
+def _native_array(geometries, encoding, interleaved):
+    """
+    GeoArrow native point or linestring array, with nulls for None.
+    """
+    coordinates_type = _coordinates_type(interleaved)
+
+    def coordinates(geometry):
+        coords = [tuple(xy) for xy in geometry.coords]
+        return coords if interleaved else [{'x': x, 'y': y} for x, y in coords]
+
+    if encoding == 'point':
+        values = [None if geometry is None else coordinates(geometry)[0] for geometry in geometries]
+        return pa.array(values, type=coordinates_type)
+    values = [None if geometry is None else coordinates(geometry) for geometry in geometries]
+    return pa.array(values, type=pa.list_(coordinates_type))
+
+
+def _write(path, geometries, encoding='WKB', interleaved=False, crs=CRS, columns=None):
+    if encoding == 'WKB':
+        geometry = pa.array(
+            [None if value is None else shapely.to_wkb(value) for value in geometries], type=pa.binary())
+    else:
+        geometry = _native_array(geometries, encoding, interleaved)
+    table = pa.table(dict(columns or {}, geometry=geometry))
+    column_metadata = {'encoding': encoding, 'geometry_types': []}
+    if crs is not None:
+        column_metadata['crs'] = crs
+    geo = {'version': '1.1.0', 'primary_column': 'geometry', 'columns': {'geometry': column_metadata}}
+    table = table.replace_schema_metadata({b'geo': json.dumps(geo).encode()})
+    pq.write_table(table, str(path))
+    return str(path)
+
+
+def _score(tmp_path, coops_path, roads_path, markets_path):
+    output = str(tmp_path / 'scored.parquet')
+    count = score_geoparquet(coops_path, roads_path, markets_path, output,
+                             ROAD_DISTANCE, MARKET_DISTANCE, ROAD_WEIGHT)
+    return count, output
+
+
+def test_wkb_scores_match_brute_force(tmp_path):
+    coops, roads, markets = _layers()
+    names = ['coop {}'.format(index) for index in range(len(coops))]
+    count, output = _score(
+        tmp_path,
+        _write(tmp_path / 'coops.parquet', coops, columns={'name': names}),
+        _write(tmp_path / 'roads.parquet', roads),
+        _write(tmp_path / 'markets.parquet', markets)
+    )
+
+    assert count == len(coops)
+    table = pq.read_table(output)
+    assert table.column_names == ['name', 'geometry', 'accessibility_score']
+    assert table.column('name').to_pylist() == names
+    np.testing.assert_allclose(table.column('accessibility_score').to_numpy(), _expected(coops, roads, markets))
+
+    # The output is still GeoParquet, with the input geometry metadata
+    geo = json.loads(table.schema.metadata[b'geo'])
+    assert geo['primary_column'] == 'geometry'
+    assert geo['columns']['geometry']['crs'] == CRS
+
+
+@pytest.mark.parametrize('interleaved', [False, True], ids=['struct', 'interleaved'])
+def test_native_scores_match_brute_force(tmp_path, interleaved):
+    coops, roads, markets = _layers()
+    # A road without a geometry is ignored
+    roads = roads + [None]
+    _, output = _score(
+        tmp_path,
+        _write(tmp_path / 'coops.parquet', coops, 'point', interleaved),
+        _write(tmp_path / 'roads.parquet', roads, 'linestring', interleaved),
+        _write(tmp_path / 'markets.parquet', markets, 'point', interleaved)
+    )
+
+    table = pq.read_table(output)
+    np.testing.assert_allclose(
+        table.column('accessibility_score').to_numpy(), _expected(coops, roads[:-1], markets))
+    assert json.loads(table.schema.metadata[b'geo'])['columns']['geometry']['encoding'] == 'point'
+
+
+def test_crs_mismatch_is_rejected(tmp_path):
+    coops, roads, markets = _layers()
+    with pytest.raises(ValueError, match='same CRS'):
+        _score(
+            tmp_path,
+            _write(tmp_path / 'coops.parquet', coops),
+            _write(tmp_path / 'roads.parquet', roads, crs={'id': {'authority': 'EPSG', 'code': 4326}}),
+            _write(tmp_path / 'markets.parquet', markets)
+        )
+
+
+def test_existing_score_column_is_rejected(tmp_path):
+    coops, roads, markets = _layers()
+    with pytest.raises(ValueError, match='accessibility_score'):
+        _score(
+            tmp_path,
+            _write(tmp_path / 'coops.parquet', coops, columns={'accessibility_score': [1.0] * len(coops)}),
+            _write(tmp_path / 'roads.parquet', roads),
+            _write(tmp_path / 'markets.parquet', markets)
+        )
@@ -0,0 +1,109 @@
+"""
+Tests of the vectorized distance engine.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+shapely = pytest.importorskip('shapely', minversion='2.0')
+
+from shapely.geometry import LineString, Point  # noqa: E402
+
+from infrastructure_accessibility import engine  # noqa: E402
+from infrastructure_accessibility.scoring import band_score  # noqa: E402
+
+
+def test_band_scores_match_band_score():
+    distances = [0, 50, 100, 100.5, 200, 350, 500, 501, np.nan]
+    expected = [band_score(None if np.isnan(d) else d, 100) for d in distances]
+    np.testing.assert_allclose(engine.band_scores(distances, 100), expected)
+
+
+@pytest.mark.parametrize('buffer_distance', [0, 100])
+def test_nearest_distances_within_search_distance(buffer_distance):
+    roads = [LineString([(0, 0), (10, 0)]), None]
+    cooperatives = np.array([Point(5, 0), Point(5, 30), Point(5, 800), None], dtype=object)
+    distances = engine.DistanceIndex(roads).nearest_distances(
+        cooperatives, engine.search_distance(buffer_distance))
+    scores = engine.band_scores(distances, buffer_distance)
+    if buffer_distance:
+        np.testing.assert_allclose(distances, [0, 30, np.nan, np.nan])
+        np.testing.assert_allclose(scores, [99, 99, 0, 0])
+    else:
+        # A buffer distance of 0 only scores cooperatives on the road
+        assert engine.search_distance(buffer_distance) is None
+        np.testing.assert_allclose(scores, [100, 0, 0, 0])
+
+
+def _brute_force_nearest(xy, target_xy, max_distance=np.inf):
+    indices, distances = [], []
+    for point in xy:
+        found = [(np.hypot(*(point - target)), index) for index, target in enumerate(target_xy)
+                 if not np.isnan(target).any()]
+        if np.isnan(point).any() or not found or min(found)[0] > max_distance:
+            indices.append(-1)
+            distances.append(np.nan)
+        else:
+            # Ties go to the first target, like merged co-located targets
+            distance, index = min(found)
+            indices.append(index)
+            distances.append(distance)
+    return np.array(indices), np.array(distances)
+
+
+@pytest.mark.parametrize('max_distance', [np.inf, 150.0])
+def test_nearest_points_match_brute_force(max_distance):
+    pytest.importorskip('scipy')
+    rng = np.random.default_rng(4)
+    xy = rng.uniform(0, 1000, (300, 2))
+    xy[[5, 17]] = np.nan
+    targets = rng.uniform(0, 1000, (20, 2))
+    targets[3] = np.nan
+    # Co-located targets go to the first of them
+    targets[12] = targets[7]
+    targets[19] = targets[7]
+
+    indices, distances = engine.nearest_points(xy, targets, max_distance)
+
+    expected_indices, expected_distances = _brute_force_nearest(xy, targets, max_distance)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances)
+    assert 7 in indices and not np.isin([3, 12, 19], indices).any()
+
+
+def test_nearest_points_without_targets():
+    pytest.importorskip('scipy')
+    indices, distances = engine.nearest_points(np.zeros((3, 2)), np.full((2, 2), np.nan))
+    np.testing.assert_array_equal(indices, [-1, -1, -1])
+    assert np.isnan(distances).all()
+
+
+def test_voronoi_cells_partition_the_extent():
+    rng = np.random.default_rng(5)
+    xy = rng.uniform(0, 1000, (25, 2))
+    xy[4] = np.nan
+    xy[9] = xy[2]
+    extent = shapely.box(-500, -500, 1500, 1500)
+
+    cells = engine.voronoi_cells(xy, extent)
+
+    assert cells[4] is None and cells[9] is None
+    located = [index for index in range(len(xy)) if cells[index] is not None]
+    assert len(located) == len(xy) - 2
+    assert sum(cells[index].area for index in located) == pytest.approx(extent.area)
+    assert shapely.union_all(cells[located]).equals(extent)
+
+    # A sample point lies in the cell of its nearest generator point,
+    # as assigned by nearest_points
+    pytest.importorskip('scipy')
+    samples = rng.uniform(-500, 1500, (500, 2))
+    nearest, _ = engine.nearest_points(samples, xy)
+    for sample, index in zip(samples, nearest):
+        assert cells[index].buffer(1e-6).contains(Point(sample))
+
+
+def test_voronoi_cells_of_a_single_location():
+    extent = shapely.box(0, 0, 10, 10)
+    cells = engine.voronoi_cells(np.array([[5.0, 5.0], [5.0, 5.0], [np.nan, np.nan]]), extent)
+    assert cells[0].equals(extent)
+    assert cells[1] is None and cells[2] is None
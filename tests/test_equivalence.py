@@ -0,0 +1,436 @@
+"""
+Equivalence tests of the accessibility scoring engines.
+
+The reference is the original buffer loop of the accessibility
+algorithm, carried here as a separate implementation: every cooperative
+gets the score of the first road and market buffer it intersects, in
+layer order. The tests check that the default analysis still scores
+exactly like it, and run every accelerated engine on randomized synthetic
+layers (projected and geographic CRSs, empty layers, multipart
+geometries, cooperatives exactly on ring boundaries) against it.
+
+The accelerated engines score by the innermost ring of any feature,
+from exact distances. A cooperative they score differently from the
+reference passes only when that difference is the innermost ring score
+of its road and market distances; these divergences are counted and
+reported at the end of the run next to the engine timings. For the road
+and the market component separately, a cooperative whose exact distance
+lies within the chord error of a ring may get the score of either band,
+since the reference buffers approximate arcs with chords. Any other
+difference fails.
+"""
+
+import math
+import os
+import random
+import time
+import warnings
+
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import (  # noqa: E402
+    QgsApplication,
+    QgsFeature,
+    QgsField,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessingFeedback,
+    QgsProviderRegistry,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from infrastructure_accessibility.scoring import band_score, combined_score, ring_distances  # noqa: E402
+
+# Segments per quarter circle of the reference buffers
+BUFFER_SEGMENTS = 5
+
+# Largest score difference treated as equal
+SCORE_TOLERANCE = 1e-6
+
+# Buffer distances in metres; geographic cases scale them to whole degrees
+# since the algorithm takes integer distances in layer units
+ROAD_DISTANCE = 1000
+MARKET_DISTANCE = 2000
+ROAD_WEIGHT = 0.6
+
+# Origins of the synthetic layers, far from zero to exercise large
+# coordinates, and the layer units per metre of the synthetic layout
+CRS_ORIGINS = {
+    'EPSG:3857': (3900000.0, -150000.0),
+    'EPSG:32736': (500000.0, 9900000.0),
+    'EPSG:21037': (250000.0, 9650000.0),
+    'EPSG:4326': (20.0, -15.0),
+}
+CRS_SCALE = {'EPSG:4326': 0.001}
+
+CASES = {
+    'random EPSG:3857': dict(crs='EPSG:3857', seed=0),
+    'random EPSG:32736': dict(crs='EPSG:32736', seed=1),
+    'random EPSG:21037': dict(crs='EPSG:21037', seed=2),
+    'geographic EPSG:4326': dict(crs='EPSG:4326', seed=3, boundary=True),
+    'ring boundaries': dict(crs='EPSG:32736', seed=10, boundary=True),
+    'multipart': dict(crs='EPSG:32736', seed=11, multipart=True, boundary=True),
+    'empty cooperatives': dict(crs='EPSG:3857', seed=12, empty=('cooperatives',)),
+    'empty roads': dict(crs='EPSG:3857', seed=13, empty=('roads',)),
+    'empty markets': dict(crs='EPSG:3857', seed=14, empty=('markets',)),
+}
+
+PROVIDER = 'infrastructureaccessibility'
+ALGORITHM = PROVIDER + ':infrastructureaccessibility'
+
+
+@pytest.fixture(scope='session')
+def qgis_processing():
+    """
+    Starts QGIS and Processing when not running inside QGIS, and
+    registers the plugin provider.
+    """
+    application = None
+    if QgsApplication.instance() is None:
+        pytest.importorskip('processing')
+        from processing.core.Processing import Processing
+
+        application = QgsApplication([], False)
+        application.initQgis()
+        Processing.initialize()
+    registry = QgsApplication.processingRegistry()
+    if registry.providerById(PROVIDER) is None:
+        from infrastructure_accessibility.provider import InfrastructureAccessibilityProvider
+        registry.addProvider(InfrastructureAccessibilityProvider())
+    yield
+    if application is not None:
+        application.exitQgis()
+
+
+def chord_error(ring):
+    """
+    Returns the largest gap between a ring and its chord approximation.
+    """
+    return ring * (1 - math.cos(math.pi / (4 * BUFFER_SEGMENTS)))
+
+
+def _layer(geometry_type, crs, name, geometries):
+    layer = QgsVectorLayer('{}?crs={}'.format(geometry_type, crs), name, 'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes([QgsField('id', QVariant.Int)])
+    layer.updateFields()
+    features = []
+    for index, geometry in enumerate(geometries):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(geometry)
+        feature.setAttributes([index])
+        features.append(feature)
+    provider.addFeatures(features)
+    return layer
+
+
+def synthetic_case(name, crs, seed, cooperatives=300, roads=25, markets=12,
+                   multipart=False, boundary=False, empty=()):
+    """
+    Returns a dictionary describing a synthetic case: its name, CRS,
+    buffer distances and cooperatives, roads and markets memory layers.
+    Layers named in empty get no features.
+    """
+    rng = random.Random(seed)
+    origin_x, origin_y = CRS_ORIGINS[crs]
+    scale = CRS_SCALE.get(crs, 1)
+    size = 30000.0 * scale
+    road_distance = int(ROAD_DISTANCE * scale)
+    market_distance = int(MARKET_DISTANCE * scale)
+
+    def point():
+        return QgsPointXY(origin_x + rng.uniform(0, size), origin_y + rng.uniform(0, size))
+
+    def line():
+        start = point()
+        reach = 4000 * scale
+        return [start, QgsPointXY(start.x() + rng.uniform(-reach, reach), start.y() + rng.uniform(-reach, reach))]
+
+    road_lines = [[line() for _ in range(rng.randint(1, 3))] if multipart else [line()] for _ in range(roads)]
+    market_points = [point() for _ in range(markets)]
+    coop_points = [[point() for _ in range(rng.randint(1, 3))] if multipart else [point()] for _ in range(cooperatives)]
+
+    if boundary:
+        # Horizontal roads, with cooperatives exactly one ring away from
+        # their middle, and cooperatives exactly one ring east of markets
+        # where the buffer polygons have a vertex
+        for _ in range(5):
+            start = point()
+            length = rng.uniform(2000, 6000) * scale
+            road_lines.append([[start, QgsPointXY(start.x() + length, start.y())]])
+            for ring in ring_distances(road_distance):
+                for side in (1, -1):
+                    coop_points.append([QgsPointXY(start.x() + length / 2, start.y() + side * ring)])
+        for market in market_points[:5]:
+            for ring in ring_distances(market_distance):
+                coop_points.append([QgsPointXY(market.x() + ring, market.y())])
+
+    if multipart:
+        coop_geometries = [QgsGeometry.fromMultiPointXY(points) for points in coop_points]
+        road_geometries = [QgsGeometry.fromMultiPolylineXY(lines) for lines in road_lines]
+        coop_type, road_type = 'MultiPoint', 'MultiLineString'
+    else:
+        coop_geometries = [QgsGeometry.fromPointXY(points[0]) for points in coop_points]
+        road_geometries = [QgsGeometry.fromPolylineXY(lines[0]) for lines in road_lines]
+        coop_type, road_type = 'Point', 'LineString'
+    market_geometries = [QgsGeometry.fromPointXY(market) for market in market_points]
+
+    return {
+        'name': name,
+        'crs': crs,
+        'road_distance': road_distance,
+        'market_distance': market_distance,
+        'cooperatives': _layer(coop_type, crs, 'cooperatives', [] if 'cooperatives' in empty else coop_geometries),
+        'roads': _layer(road_type, crs, 'roads', [] if 'roads' in empty else road_geometries),
+        'markets': _layer('Point', crs, 'markets', [] if 'markets' in empty else market_geometries),
+    }
+
+
+def _algorithm_scores(case, extra_parameters, layers=None):
+    import processing
+
+    layers = layers if layers is not None else case
+    parameters = {
+        'INPUT_COOPERATIVES': layers['cooperatives'],
+        'INPUT_ROADS': layers['roads'],
+        'INPUT_MARKETS': layers['markets'],
+        'ROAD_BUFFER_DISTANCE': case['road_distance'],
+        'MARKET_BUFFER_DISTANCE': case['market_distance'],
+        'ROAD_WEIGHT': ROAD_WEIGHT,
+        'OUTPUT': 'memory:'
+    }
+    parameters.update(extra_parameters)
+    output = processing.run(ALGORITHM, parameters, feedback=QgsProcessingFeedback())['OUTPUT']
+    return {feature['id']: feature['accessibility_score'] for feature in output.getFeatures()}
+
+
+def _first_hit_buffers(layer, buffer_distance):
+    import processing
+
+    return processing.run('native:multiplebuffer', {
+        'INPUT': layer,
+        'DISTANCE': [buffer_distance, buffer_distance * 2, buffer_distance * 5],
+        'SEGMENTS': BUFFER_SEGMENTS,
+        'DISSOLVE': False,
+        'OUTPUT': 'memory:'
+    }, feedback=QgsProcessingFeedback())['OUTPUT']
+
+
+def _first_hit_score(point, buffers):
+    for buffer_feat in buffers:
+        if point.intersects(buffer_feat.geometry()):
+            return 100 - (buffer_feat['distance'] * 0.01)
+    return 0
+
+
+def reference_scores(case):
+    """
+    Scores a case with the original buffer loop of the accessibility
+    algorithm: the first road and market buffer a cooperative intersects,
+    in layer order, gives its score.
+    """
+    road_buffers = list(_first_hit_buffers(case['roads'], case['road_distance']).getFeatures())
+    market_buffers = list(_first_hit_buffers(case['markets'], case['market_distance']).getFeatures())
+    return {
+        feature['id']: combined_score(
+            _first_hit_score(feature.geometry(), road_buffers),
+            _first_hit_score(feature.geometry(), market_buffers),
+            ROAD_WEIGHT
+        )
+        for feature in case['cooperatives'].getFeatures()
+    }
+
+
+def default_scores(case):
+    """
+    Scores a case with the accessibility algorithm and no option set.
+    """
+    return _algorithm_scores(case, {})
+
+
+def cell_cache_scores(case, tmp_path):
+    """
+    Scores a case with the quantized per-cell score cache.
+    """
+    return _algorithm_scores(case, {'SCORE_CACHE_CELL_SIZE': case['road_distance'] / 4.0})
+
+
+def out_of_core_scores(case, tmp_path):
+    """
+    Scores a case with roads in the disk-backed packed R-tree.
+    """
+    return _algorithm_scores(case, {'ROAD_MEMORY_BUDGET': 1})
+
+
+def pushdown_scores(case, tmp_path):
+    """
+    Scores a case in a GeoPackage through the database pushdown.
+    """
+    path = os.path.join(str(tmp_path), 'case.gpkg')
+    layers = {}
+    for name in ('cooperatives', 'roads', 'markets'):
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.layerName = name
+        if os.path.exists(path):
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+        QgsVectorFileWriter.writeAsVectorFormatV2(
+            case[name], path, case[name].transformContext(), options)
+        layers[name] = QgsVectorLayer('{}|layername={}'.format(path, name), name, 'ogr')
+
+    # The GeoPackage SQL needs the SpatiaLite functions in GDAL
+    connection = QgsProviderRegistry.instance().providerMetadata('ogr').createConnection(path, {})
+    try:
+        connection.executeSql('SELECT ST_Distance(MakePoint(0, 0), MakePoint(1, 1))')
+    except Exception as e:
+        pytest.skip('no spatial SQL functions in GeoPackages ({})'.format(e))
+
+    return _algorithm_scores(case, {'DATABASE_PUSHDOWN': True}, layers)
+
+
+def vectorized_scores(case, tmp_path):
+    """
+    Scores a case with the vectorized distance engine used by the
+    GeoParquet, sensitivity and temporal analyses.
+    """
+    pytest.importorskip('numpy')
+    pytest.importorskip('shapely', minversion='2.0')
+    from infrastructure_accessibility import engine
+
+    road_distance = case['road_distance']
+    market_distance = case['market_distance']
+    coop_ids, cooperatives = engine.geometries_from_features(case['cooperatives'].getFeatures())
+    _, roads = engine.geometries_from_features(case['roads'].getFeatures())
+    _, markets = engine.geometries_from_features(case['markets'].getFeatures())
+    road = engine.band_scores(engine.DistanceIndex(roads).nearest_distances(
+        cooperatives, engine.search_distance(road_distance)), road_distance)
+    market = engine.band_scores(engine.DistanceIndex(markets).nearest_distances(
+        cooperatives, engine.search_distance(market_distance)), market_distance)
+    ids = {feature.id(): feature['id'] for feature in case['cooperatives'].getFeatures()}
+    return {
+        ids[fid]: float(score)
+        for fid, score in zip(coop_ids, combined_score(road, market, ROAD_WEIGHT))
+    }
+
+
+ENGINES = {
+    'cell cache': cell_cache_scores,
+    'out-of-core': out_of_core_scores,
+    'vectorized': vectorized_scores,
+    'pushdown (GeoPackage)': pushdown_scores,
+}
+
+
+def _nearest_distance(geometry, layer):
+    distances = [geometry.distance(feature.geometry()) for feature in layer.getFeatures()]
+    return min(distances) if distances else None
+
+
+def allowed_band_scores(distance, buffer_distance):
+    """
+    Returns the innermost ring scores allowed at an exact distance: the
+    exact band score, plus the score of the neighbouring band when the
+    distance lies within the chord error of a ring. None means no
+    infrastructure.
+    """
+    scores = {band_score(distance, buffer_distance)}
+    if distance is None:
+        return scores
+    for ring in ring_distances(buffer_distance):
+        error = chord_error(ring)
+        if abs(distance - ring) <= error:
+            scores.update(band_score(distance + delta, buffer_distance) for delta in (-error, error))
+    return scores
+
+
+def innermost_scores(case, geometry):
+    """
+    Returns the innermost ring accessibility scores allowed for a
+    cooperative geometry, combining the allowed road and market band
+    scores.
+    """
+    road_scores = allowed_band_scores(_nearest_distance(geometry, case['roads']), case['road_distance'])
+    market_scores = allowed_band_scores(_nearest_distance(geometry, case['markets']), case['market_distance'])
+    return [combined_score(road, market, ROAD_WEIGHT) for road in road_scores for market in market_scores]
+
+
+def compare(case, reference, candidate):
+    """
+    Compares candidate scores with the reference. Returns the ids of the
+    cooperatives the candidate scores by the innermost ring where the
+    reference does not, and the ids of those scored differently in any
+    other way. Differences where both scores are innermost ring scores
+    within the chord error are neither.
+    """
+    diverging = []
+    failures = []
+    geometries = {feature['id']: feature.geometry() for feature in case['cooperatives'].getFeatures()}
+    for coop_id in sorted(set(reference) | set(candidate)):
+        expected = reference.get(coop_id)
+        actual = candidate.get(coop_id)
+        if expected is None or actual is None:
+            failures.append(coop_id)
+            continue
+        if abs(expected - actual) <= SCORE_TOLERANCE:
+            continue
+        geometry = geometries.get(coop_id)
+        allowed = innermost_scores(case, geometry) if geometry is not None else []
+        if not any(abs(actual - score) <= SCORE_TOLERANCE for score in allowed):
+            failures.append(coop_id)
+        elif not any(abs(expected - score) <= SCORE_TOLERANCE for score in allowed):
+            diverging.append(coop_id)
+    return diverging, failures
+
+
+@pytest.fixture(scope='session')
+def scored_cases(qgis_processing, engine_results):
+    """
+    Builds the synthetic cases and their reference scores on first use.
+    """
+    cache = {}
+
+    def scored(name):
+        if name not in cache:
+            case = synthetic_case(name, **CASES[name])
+            start = time.perf_counter()
+            reference = reference_scores(case)
+            engine_results.append((name, 'reference', time.perf_counter() - start, None))
+            cache[name] = case, reference
+        return cache[name]
+
+    return scored
+
+
+@pytest.mark.parametrize('case_name', list(CASES))
+def test_default_analysis_matches_reference(scored_cases, engine_results, case_name):
+    case, reference = scored_cases(case_name)
+    start = time.perf_counter()
+    scores = default_scores(case)
+    engine_results.append((case_name, 'default', time.perf_counter() - start, 0))
+
+    assert scores.keys() == reference.keys()
+    differing = [coop_id for coop_id in reference if abs(scores[coop_id] - reference[coop_id]) > SCORE_TOLERANCE]
+    assert not differing, '{} cooperatives differ from the original buffer loop: {}'.format(
+        len(differing), differing[:10])
+
+
+@pytest.mark.parametrize('engine_name', list(ENGINES))
+@pytest.mark.parametrize('case_name', list(CASES))
+def test_engine_matches_reference(scored_cases, engine_results, tmp_path, case_name, engine_name):
+    case, reference = scored_cases(case_name)
+    start = time.perf_counter()
+    candidate = ENGINES[engine_name](case, tmp_path)
+    elapsed = time.perf_counter() - start
+
+    diverging, failures = compare(case, reference, candidate)
+    engine_results.append((case_name, engine_name, elapsed, len(diverging)))
+    if diverging:
+        warnings.warn('{}, {}: {} of {} cooperatives get the innermost ring score instead of the '
+                      'first buffer in layer order: {}'.format(
+                          case_name, engine_name, len(diverging), len(reference), diverging[:10]))
+    assert not failures, '{} cooperatives are scored neither like the original buffer loop nor by the ' \
+        'innermost ring: {}'.format(len(failures), failures[:10])
@@ -0,0 +1,105 @@
+"""
+Tests of the local landcover masking pipeline on small synthetic rasters.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+rasterio = pytest.importorskip('rasterio')
+pytest.importorskip('fiona')
+
+from rasterio.crs import CRS  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+
+SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, 'gee-landcover-masking', 'landcover_mask.py')
+
+CRS_UTM = CRS.from_epsg(32736)
+ORIGIN = (500000.0, 9900000.0)
+PIXEL = 10.0
+SIZE = 12
+YEARS = ('2013', '2015')
+
+
+def _load_module():
+    spec = importlib.util.spec_from_file_location('landcover_mask', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so the worker processes can unpickle its functions
+    sys.modules['landcover_mask'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _write(path, data, transform, dtype, nodata=None):
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=data.shape[2], height=data.shape[1], count=data.shape[0],
+        dtype=dtype, crs=CRS_UTM, transform=transform, nodata=nodata
+    ) as dst:
+        dst.write(data.astype(dtype))
+
+
+def _box(col_min, row_min, col_max, row_max):
+    """
+    GeoJSON polygon covering whole pixels of the yearly grid.
+    """
+    x0 = ORIGIN[0] + col_min * PIXEL
+    x1 = ORIGIN[0] + col_max * PIXEL
+    y0 = ORIGIN[1] - row_max * PIXEL
+    y1 = ORIGIN[1] - row_min * PIXEL
+    return {'type': 'Polygon', 'coordinates': [[(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]]}
+
+
+@pytest.fixture
+def scene(tmp_path):
+    rng = np.random.default_rng(1)
+    images = {}
+    for year in YEARS:
+        path = str(tmp_path / 'landsat_{}.tif'.format(year))
+        _write(path, rng.uniform(0, 1, (2, SIZE, SIZE)), from_origin(*ORIGIN, PIXEL, PIXEL), 'float32')
+        images[year] = path
+
+    # WorldCover at twice the pixel size: each cell covers 2 x 2 yearly pixels
+    landcover = rng.choice([10, 20, 30, 40, 60, 80], size=(1, SIZE // 2, SIZE // 2))
+    landcover_path = str(tmp_path / 'worldcover.tif')
+    _write(landcover_path, landcover, from_origin(*ORIGIN, PIXEL * 2, PIXEL * 2), 'uint8')
+
+    polygons = [('A', _box(1, 1, 6, 7)), ('B', _box(5, 4, 12, 11))]
+    return images, landcover_path, landcover[0], polygons
+
+
+def test_masked_pixels_are_nodata_and_kept_pixels_match(scene, tmp_path):
+    landcover_mask = _load_module()
+    images, landcover_path, landcover, polygons = scene
+    output_dir = str(tmp_path / 'out')
+
+    paths = landcover_mask.mask_landcover(
+        landcover_path, images, polygons, output_dir, max_pixels=2 * SIZE, max_workers=1)
+
+    assert sorted(os.path.basename(path) for path in paths) == sorted(
+        'NDFI_Masked_{}_{}.tif'.format(year, area) for year in YEARS for area, _ in polygons)
+
+    classes = np.isin(landcover, landcover_mask.LANDCOVER_CLASSES).repeat(2, axis=0).repeat(2, axis=1)
+    boxes = {'A': (1, 1, 6, 7), 'B': (5, 4, 12, 11)}
+    kept = masked = 0
+    for year in YEARS:
+        with rasterio.open(images[year]) as src:
+            source = src.read()
+        for area, (col_min, row_min, col_max, row_max) in boxes.items():
+            with rasterio.open(os.path.join(output_dir, 'NDFI_Masked_{}_{}.tif'.format(year, area))) as dst:
+                assert (dst.height, dst.width) == (row_max - row_min, col_max - col_min)
+                assert dst.transform == from_origin(
+                    ORIGIN[0] + col_min * PIXEL, ORIGIN[1] - row_min * PIXEL, PIXEL, PIXEL)
+                result = dst.read()
+
+            keep = classes[row_min:row_max, col_min:col_max]
+            expected = source[:, row_min:row_max, col_min:col_max]
+            np.testing.assert_array_equal(result[:, keep], expected[:, keep])
+            assert np.isnan(result[:, ~keep]).all()
+            kept += keep.sum()
+            masked += (~keep).sum()
+
+    # The random landcover must exercise both branches
+    assert kept and masked
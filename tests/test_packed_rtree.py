@@ -0,0 +1,92 @@
+"""
+Tests of the disk-backed packed R-tree and its memory budgets.
+"""
+
+import random
+import struct
+import tracemalloc
+
+import pytest
+
+from infrastructure_accessibility.packed_rtree import PackedRTree, SegmentCache
+
+EXTENT = (0.0, 0.0, 1005.0, 1005.0)
+SEGMENTS = 20000
+
+
+def _segments(count, seed=1):
+    rng = random.Random(seed)
+    for index in range(count):
+        x = rng.uniform(0, 1000)
+        y = rng.uniform(0, 1000)
+        yield (x, y, x + rng.uniform(0, 5), y + rng.uniform(0, 5)), struct.pack('<3d', index, x, y)
+
+
+def _brute_force(xmin, ymin, xmax, ymax):
+    found = set()
+    offset = 0
+    for bbox, wkb in _segments(SEGMENTS):
+        if not (bbox[0] > xmax or bbox[2] < xmin or bbox[1] > ymax or bbox[3] < ymin):
+            found.add((offset, len(wkb)))
+        offset += len(wkb)
+    return found
+
+
+@pytest.mark.parametrize('budget', [20000, 100000, 1000000])
+def test_search_matches_brute_force(tmp_path, budget):
+    # The smallest budget forces several merge passes
+    tree, runs, _ = PackedRTree.build(_segments(SEGMENTS), EXTENT, str(tmp_path), budget)
+    try:
+        assert len(tree) == SEGMENTS
+        assert runs > 1
+        for query in [(100, 100, 150, 130), (0, 0, 10, 10), (990, 990, 1005, 1005), (2000, 2000, 3000, 3000)]:
+            assert set(tree.search(*query)) == _brute_force(*query)
+        offset, length = sorted(tree.search(100, 100, 150, 130))[0]
+        assert len(tree.wkb(offset, length)) == length
+    finally:
+        tree.close()
+
+
+@pytest.mark.parametrize('budget', [100000, 1000000])
+def test_sort_keeps_within_budget(tmp_path, budget):
+    tracemalloc.start()
+    try:
+        tree, _, peak = PackedRTree.build(_segments(SEGMENTS), EXTENT, str(tmp_path), budget)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    tree.close()
+
+    assert peak <= budget
+    # Fixed overhead of the generator, file objects and run list
+    assert traced_peak <= budget + 16384
+
+
+class _FakeTree:
+    def wkb(self, offset, length):
+        return bytes(length)
+
+
+def test_segment_cache_never_exceeds_budget():
+    cache = SegmentCache(_FakeTree(), 2000, bytes, overhead=100)
+    rng = random.Random(2)
+    for _ in range(500):
+        offset = rng.randrange(40)
+        cache.get(offset, 100 + offset * 10)
+        assert cache.size <= cache.budget
+        assert cache.size == sum(size for _, size in cache.segments.values())
+    assert 0 < cache.peak <= cache.budget
+
+
+def test_segment_cache_evicts_least_recently_used():
+    cache = SegmentCache(_FakeTree(), 1000, bytes, overhead=0)
+    cache.get(0, 400)
+    cache.get(1, 400)
+    cache.get(0, 400)
+    cache.get(2, 400)
+    assert list(cache.segments) == [0, 2]
+    assert cache.loads == 3
+
+    # Larger than the whole budget: returned, not cached
+    assert len(cache.get(3, 2000)) == 2000
+    assert list(cache.segments) == [0, 2]
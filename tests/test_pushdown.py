@@ -0,0 +1,190 @@
+"""
+Tests of the database pushdown SQL.
+
+The GeoPackage query runs on SQLite's R*Tree with the ST_ functions that
+GDAL provides to GeoPackage connections registered from Shapely. The
+SpatiaLite query runs when the mod_spatialite extension can be loaded.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+from infrastructure_accessibility.pushdown import (
+    GEOPACKAGE,
+    POSTGIS,
+    SPATIALITE,
+    DatabaseTable,
+    _score_case,
+    build_score_query,
+    has_spatial_index,
+)
+from infrastructure_accessibility.scoring import band_score
+
+ROAD_DISTANCE = 100
+MARKET_DISTANCE = 200
+
+
+def _tables(provider, geometry_column='geom'):
+    return [
+        DatabaseTable(provider, 'db', 'public' if provider == POSTGIS else None, name, geometry_column, 'id')
+        for name in ('coops', 'roads', 'markets')
+    ]
+
+
+def _layers(seed=3):
+    """
+    Random cooperatives, roads and markets as WKT, with cooperatives
+    exactly on ring distances among them.
+    """
+    rng = random.Random(seed)
+    coops = ['POINT ({} {})'.format(rng.uniform(0, 3000), rng.uniform(0, 3000)) for _ in range(60)]
+    roads = []
+    for _ in range(6):
+        x, y = rng.uniform(0, 3000), rng.uniform(0, 3000)
+        roads.append('LINESTRING ({} {}, {} {})'.format(x, y, x + rng.uniform(-800, 800), y + rng.uniform(-800, 800)))
+    markets = ['POINT ({} {})'.format(rng.uniform(0, 3000), rng.uniform(0, 3000)) for _ in range(4)]
+    market_x, market_y = (float(value) for value in markets[0][7:-1].split())
+    for ring in (MARKET_DISTANCE, 2 * MARKET_DISTANCE, 5 * MARKET_DISTANCE):
+        coops.append('POINT ({} {})'.format(market_x + ring, market_y))
+    return coops, roads, markets
+
+
+def _expected(coops, roads, markets):
+    shapely = pytest.importorskip('shapely')
+    road_geometries = [shapely.from_wkt(wkt) for wkt in roads]
+    market_geometries = [shapely.from_wkt(wkt) for wkt in markets]
+    expected = {}
+    for index, wkt in enumerate(coops, start=1):
+        point = shapely.from_wkt(wkt)
+        expected[index] = (
+            band_score(min(point.distance(road) for road in road_geometries), ROAD_DISTANCE),
+            band_score(min(point.distance(market) for market in market_geometries), MARKET_DISTANCE),
+        )
+    return expected
+
+
+def _check_scores(rows, expected):
+    scores = {row[0]: (row[3], row[4]) for row in rows}
+    assert scores.keys() == expected.keys()
+    for key, (road_score, market_score) in expected.items():
+        assert scores[key] == pytest.approx((road_score, market_score)), key
+
+
+@pytest.mark.parametrize('distance', [None, 0, 50, 100, 100.001, 150, 200, 499.9, 500, 500.5, 10000])
+def test_score_case_matches_band_score(distance):
+    connection = sqlite3.connect(':memory:')
+    literal = 'NULL' if distance is None else repr(float(distance))
+    (score,), = connection.execute('SELECT {}'.format(_score_case(literal, ROAD_DISTANCE))).fetchall()
+    assert score == pytest.approx(band_score(distance, ROAD_DISTANCE))
+
+
+def test_postgis_query_uses_index_ordered_nearest_search():
+    sql = build_score_query(_tables(POSTGIS), ROAD_DISTANCE, MARKET_DISTANCE)
+    assert sql.count('LEFT JOIN LATERAL') == 2
+    assert 'ST_DWithin(c."geom", r."geom", 500.0)' in sql
+    assert 'ST_DWithin(c."geom", m."geom", 1000.0)' in sql
+    assert 'ORDER BY c."geom" <-> r."geom" LIMIT 1' in sql
+    assert '"public"."roads"' in sql
+
+
+def test_queries_quote_identifiers():
+    tables = [table._replace(table='my "roads"') for table in _tables(SPATIALITE, 'the geom')]
+    sql = build_score_query(tables, ROAD_DISTANCE, MARKET_DISTANCE)
+    assert '"my ""roads"""' in sql
+    assert "f_table_name = 'my \"roads\"'" in sql
+    assert 'c."the geom"' in sql
+
+
+def _geopackage_database(coops, roads, markets, indexed=('roads', 'markets')):
+    shapely = pytest.importorskip('shapely')
+    connection = sqlite3.connect(':memory:')
+
+    def geometry(function):
+        return lambda wkt: None if wkt is None else function(shapely.from_wkt(wkt))
+
+    # GDAL provides these to GeoPackage connections; the geometries are
+    # stored as WKT here instead of GeoPackage blobs
+    connection.create_function('ST_MinX', 1, geometry(lambda g: g.bounds[0]))
+    connection.create_function('ST_MinY', 1, geometry(lambda g: g.bounds[1]))
+    connection.create_function('ST_MaxX', 1, geometry(lambda g: g.bounds[2]))
+    connection.create_function('ST_MaxY', 1, geometry(lambda g: g.bounds[3]))
+    connection.create_function(
+        'ST_Distance', 2, lambda a, b: shapely.from_wkt(a).distance(shapely.from_wkt(b)))
+
+    for name, values in (('coops', coops), ('roads', roads), ('markets', markets)):
+        connection.execute('CREATE TABLE {} (id INTEGER PRIMARY KEY, geom TEXT)'.format(name))
+        connection.executemany(
+            'INSERT INTO {} (id, geom) VALUES (?, ?)'.format(name),
+            list(enumerate(values, start=1)))
+        if name in indexed:
+            connection.execute(
+                'CREATE VIRTUAL TABLE rtree_{}_geom USING rtree(id, minx, maxx, miny, maxy)'.format(name))
+            for key, wkt in enumerate(values, start=1):
+                minx, miny, maxx, maxy = shapely.from_wkt(wkt).bounds
+                connection.execute(
+                    'INSERT INTO rtree_{}_geom VALUES (?, ?, ?, ?, ?)'.format(name),
+                    (key, minx, maxx, miny, maxy))
+    return connection
+
+
+def test_geopackage_query_matches_exact_scores():
+    coops, roads, markets = _layers()
+    connection = _geopackage_database(coops, roads, markets)
+    sql = build_score_query(_tables(GEOPACKAGE), ROAD_DISTANCE, MARKET_DISTANCE)
+    _check_scores(connection.execute(sql).fetchall(), _expected(coops, roads, markets))
+
+
+def test_geopackage_spatial_index_detection():
+    coops, roads, markets = _layers()
+    execute = lambda sql: connection.execute(sql).fetchall()  # noqa: E731
+    _, road_table, market_table = _tables(GEOPACKAGE)
+
+    connection = _geopackage_database(coops, roads, markets)
+    assert has_spatial_index(execute, road_table)
+    assert has_spatial_index(execute, market_table)
+
+    connection = _geopackage_database(coops, roads, markets, indexed=('roads',))
+    assert has_spatial_index(execute, road_table)
+    assert not has_spatial_index(execute, market_table)
+
+
+@pytest.fixture
+def spatialite():
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.enable_load_extension(True)
+        connection.load_extension('mod_spatialite')
+    except (AttributeError, sqlite3.OperationalError) as e:
+        pytest.skip('mod_spatialite is not available: {}'.format(e))
+    connection.execute('SELECT InitSpatialMetadata(1)')
+    return connection
+
+
+def _spatialite_tables(connection, coops, roads, markets, indexed=('roads', 'markets')):
+    for name, values, kind in (('coops', coops, 'POINT'), ('roads', roads, 'LINESTRING'),
+                               ('markets', markets, 'POINT')):
+        connection.execute('CREATE TABLE {} (id INTEGER PRIMARY KEY)'.format(name))
+        connection.execute("SELECT AddGeometryColumn('{}', 'geom', 32736, '{}', 'XY')".format(name, kind))
+        connection.executemany(
+            'INSERT INTO {} (id, geom) VALUES (?, GeomFromText(?, 32736))'.format(name),
+            list(enumerate(values, start=1)))
+        if name in indexed:
+            connection.execute("SELECT CreateSpatialIndex('{}', 'geom')".format(name))
+
+
+def test_spatialite_query_matches_exact_scores(spatialite):
+    coops, roads, markets = _layers()
+    _spatialite_tables(spatialite, coops, roads, markets)
+    sql = build_score_query(_tables(SPATIALITE), ROAD_DISTANCE, MARKET_DISTANCE)
+    _check_scores(spatialite.execute(sql).fetchall(), _expected(coops, roads, markets))
+
+
+def test_spatialite_spatial_index_detection(spatialite):
+    coops, roads, markets = _layers()
+    _spatialite_tables(spatialite, coops, roads, markets, indexed=('roads',))
+    execute = lambda sql: spatialite.execute(sql).fetchall()  # noqa: E731
+    _, road_table, market_table = _tables(SPATIALITE)
+    assert has_spatial_index(execute, road_table)
+    assert not has_spatial_index(execute, market_table)
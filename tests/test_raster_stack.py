@@ -0,0 +1,107 @@
+"""
+Tests of the NDFI stack tools on small synthetic GeoTIFFs.
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.crs import CRS  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+
+SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, 'gee-landcover-masking', 'raster_stack.py')
+
+TRANSFORM = from_origin(500000.0, 9900000.0, 30.0, 30.0)
+NAMES = ['2013', '2015', '2017']
+
+
+def _load_module():
+    spec = importlib.util.spec_from_file_location('raster_stack', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+raster_stack = _load_module()
+
+
+def _write_stack(path, bands=3, height=40, width=50, seed=0):
+    data = np.random.default_rng(seed).uniform(-1, 1, (bands, height, width)).astype('float32')
+    with rasterio.open(
+        str(path), 'w', driver='GTiff', width=width, height=height, count=bands, dtype='float32',
+        crs=CRS.from_epsg(32736), transform=TRANSFORM, tiled=True, blockxsize=16, blockysize=16
+    ) as dst:
+        dst.write(data)
+    return str(path), data
+
+
+def test_set_band_descriptions_keeps_pixels(tmp_path):
+    path, data = _write_stack(tmp_path / 'stack.tif')
+    with open(path, 'rb') as raster:
+        size = len(raster.read())
+
+    raster_stack.set_band_descriptions(path, NAMES)
+
+    with rasterio.open(path) as src:
+        assert src.descriptions == tuple(NAMES)
+        assert src.transform == TRANSFORM
+        np.testing.assert_array_equal(src.read(), data)
+    # Only the metadata was rewritten, the file was not recompressed
+    with open(path, 'rb') as raster:
+        assert abs(len(raster.read()) - size) < 1024
+
+
+def test_set_band_descriptions_rejects_band_count_mismatch(tmp_path):
+    path, _ = _write_stack(tmp_path / 'stack.tif', bands=2)
+    with pytest.raises(ValueError, match='has 2 bands but 3 names'):
+        raster_stack.set_band_descriptions(path, NAMES)
+    with rasterio.open(path) as src:
+        assert src.descriptions == (None, None)
+
+
+def test_rename_bands_reports_each_file(tmp_path):
+    paths = [_write_stack(tmp_path / 'stack_{}.tif'.format(index), seed=index)[0] for index in range(4)]
+    paths.append(_write_stack(tmp_path / 'two_bands.tif', bands=2)[0])
+
+    results = dict(raster_stack.rename_bands(paths, NAMES, max_workers=3))
+
+    assert sorted(results) == sorted(paths)
+    assert isinstance(results.pop(paths[-1]), ValueError)
+    assert all(error is None for error in results.values())
+    for path in paths[:-1]:
+        with rasterio.open(path) as src:
+            assert src.descriptions == tuple(NAMES)
+
+
+@pytest.mark.parametrize('max_pixels', [10 ** 6, 50 * 16, 100])
+def test_map_windows_matches_whole_raster(tmp_path, max_pixels):
+    path, data = _write_stack(tmp_path / 'stack.tif')
+    raster_stack.set_band_descriptions(path, NAMES)
+    windows = []
+
+    def function(block, window):
+        windows.append(window)
+        # Tag every pixel with its window, to check where it was written
+        return (block * 2 + len(windows)).astype('float64')
+
+    output = raster_stack.map_windows(path, str(tmp_path / 'out.tif'), function, max_pixels, dtype='float64')
+
+    with rasterio.open(output) as dst:
+        assert dst.dtypes == ('float64',) * 3
+        assert dst.descriptions == tuple(NAMES)
+        result = dst.read()
+
+    tags = np.zeros(data.shape[1:])
+    for tag, window in enumerate(windows, start=1):
+        assert window.height * window.width <= max(max_pixels, 16 * 16)
+        rows, columns = window.toslices()
+        assert not tags[rows, columns].any()
+        tags[rows, columns] = tag
+    assert tags.all()
+    np.testing.assert_allclose(result, data * 2 + tags)
+    if max_pixels < 50 * 40:
+        assert len(windows) > 1
@@ -0,0 +1,83 @@
+"""
+Tests of the chunked Monte-Carlo sensitivity analysis.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from infrastructure_accessibility.sensitivity import (  # noqa: E402
+    _MomentAccumulator,
+    analyse,
+    competition_ranks,
+    rank_groups,
+    sample_parameters,
+    scores_matrix,
+)
+
+BASELINE = (0.6, 1000, 2000)
+
+
+def _distances(count=200, seed=0):
+    generator = np.random.default_rng(seed)
+    road = generator.uniform(0, 6000, count)
+    market = generator.uniform(0, 12000, count)
+    # Cooperatives without a road or market in reach
+    road[::17] = np.nan
+    market[::23] = np.nan
+    return road, market
+
+
+def _samples(count=250, seed=1):
+    return sample_parameters(count, (0.3, 0.9), (500, 1500), (1000, 3000), seed=seed)
+
+
+def test_competition_ranks_match_scipy():
+    stats = pytest.importorskip('scipy.stats')
+    road, market = _distances()
+    # Ring scores give many ties
+    scores = scores_matrix(road, market, *_samples(40))
+    ranks = competition_ranks(scores)
+    for column in range(scores.shape[1]):
+        np.testing.assert_array_equal(ranks[:, column], stats.rankdata(-scores[:, column], method='min'))
+
+
+def test_moment_accumulator_matches_whole_matrix():
+    road, market = _distances()
+    scores = scores_matrix(road, market, *_samples())
+    moments = _MomentAccumulator(len(road))
+    # Uneven chunks, including a single sample
+    for chunk in np.split(scores, [7, 100, 101, 180], axis=1):
+        moments.add_chunk(chunk)
+    assert moments.count == scores.shape[1]
+    np.testing.assert_allclose(moments.mean, scores.mean(axis=1))
+    np.testing.assert_allclose(moments.std(), scores.std(axis=1), atol=1e-9)
+
+
+def test_analyse_matches_full_matrix():
+    road, market = _distances()
+    samples = _samples()
+    summary = analyse(road, market, samples, BASELINE, chunk_size=64)
+
+    scores = scores_matrix(road, market, *samples)
+    ranks = competition_ranks(scores)
+    baseline_scores = scores_matrix(road, market, *(np.array([value]) for value in BASELINE))
+    baseline_groups = rank_groups(competition_ranks(baseline_scores)[:, 0], len(road))
+
+    np.testing.assert_allclose(summary.baseline_score, baseline_scores[:, 0])
+    np.testing.assert_allclose(summary.score_mean, scores.mean(axis=1))
+    np.testing.assert_allclose(summary.score_std, scores.std(axis=1), atol=1e-9)
+    np.testing.assert_allclose(summary.rank_mean, ranks.mean(axis=1))
+    np.testing.assert_allclose(summary.rank_std, ranks.std(axis=1), atol=1e-9)
+    np.testing.assert_allclose(
+        summary.rank_stability, (rank_groups(ranks, len(road)) == baseline_groups[:, None]).mean(axis=1))
+
+
+def test_analyse_does_not_depend_on_chunk_size():
+    road, market = _distances(seed=3)
+    samples = _samples(seed=4)
+    reference = analyse(road, market, samples, BASELINE, chunk_size=len(samples[0]))
+    for chunk_size in (1, 13, 100, 1000):
+        summary = analyse(road, market, samples, BASELINE, chunk_size=chunk_size)
+        for name, values in summary._asdict().items():
+            np.testing.assert_allclose(values, getattr(reference, name), atol=1e-9, err_msg=name)
@@ -0,0 +1,166 @@
+"""
+Startup budget test of the plugin.
+
+QGIS imports the plugin package and calls classFactory while the
+application starts; registering the provider makes Processing load its
+algorithms. This test runs that path in a fresh interpreter with Python's
+import time tracing (python -X importtime), after starting QGIS and
+importing the qgis modules it has already loaded by then, and checks the
+imports it causes: they must stay within the budget, and Processing,
+NumPy and the other compute backends must wait for the first run of an
+algorithm.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Import time of the plugin at startup, in milliseconds
+STARTUP_BUDGET_MS = 100
+
+# Number of measurements, the fastest one is kept
+RUNS = 3
+
+PACKAGE = 'infrastructure_accessibility'
+
+# Modules that must only be imported when an algorithm runs
+DEFERRED_MODULES = (
+    'processing',
+    'numpy',
+    'shapely',
+    'scipy',
+    'pyarrow',
+    PACKAGE + '.columnar',
+    PACKAGE + '.engine',
+    PACKAGE + '.packed_rtree',
+    PACKAGE + '.pushdown',
+    PACKAGE + '.ring_bands',
+    PACKAGE + '.sensitivity',
+    PACKAGE + '.temporal',
+    PACKAGE + '.zonal',
+)
+
+MARKER = 'startup-budget: plugin imports'
+
+# Starts QGIS like the application does before loading plugins, then
+# loads the plugin through classFactory with a stand-in interface and
+# prints the ids of the algorithms the provider registered
+SCRIPT = '''
+import sys
+import types
+import qgis.core
+import qgis.PyQt.QtCore
+import qgis.PyQt.QtGui
+from qgis.core import QgsApplication
+
+application = QgsApplication([], False)
+application.initQgis()
+iface = types.SimpleNamespace()
+sys.stderr.write({marker!r} + '\\n')
+
+import {package}
+provider = {package}.classFactory(iface)
+
+for algorithm in provider.algorithms():
+    print(algorithm.id())
+'''.format(marker=MARKER, package=PACKAGE)
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def parse_importtime(output):
+    """
+    Returns the (module, self time in microseconds) of every import traced
+    after the marker line in the stderr output of python -X importtime.
+    """
+    imports = []
+    started = False
+    for line in output.splitlines():
+        if line.strip() == MARKER:
+            started = True
+            continue
+        if not started or not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # Header line
+            continue
+        imports.append((fields[2].strip(), int(fields[0])))
+    return imports
+
+
+def deferred_imports(imports):
+    """
+    Returns the traced modules that should only be imported on first run.
+    """
+    return sorted({
+        module for module, _ in imports
+        if any(module == deferred or module.startswith(deferred + '.') for deferred in DEFERRED_MODULES)
+    })
+
+
+def measure():
+    """
+    Loads the plugin in a fresh interpreter and returns the traced imports
+    and the ids of the registered algorithms.
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        path for path in (ROOT, environment.get('PYTHONPATH')) if path)
+    environment.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT],
+        cwd=ROOT,
+        env=environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    assert process.returncode == 0, 'Loading the plugin failed:\n{}'.format(
+        '\n'.join(line for line in process.stderr.splitlines() if not line.startswith('import time:')))
+    return parse_importtime(process.stderr), process.stdout.split()
+
+
+@pytest.fixture(scope='module')
+def startup():
+    """
+    The fastest of RUNS measurements: its imports, their total time in
+    milliseconds and the registered algorithm ids.
+    """
+    pytest.importorskip('qgis.core')
+    measurements = [measure() for _ in range(RUNS)]
+    imports, algorithms = min(measurements, key=lambda item: sum(time for _, time in item[0]))
+    return imports, sum(time for _, time in imports) / 1000.0, algorithms
+
+
+def test_parse_importtime_skips_imports_before_marker():
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 | qgis.core',
+        MARKER,
+        'import time:        35 |         35 |   infrastructure_accessibility.provider',
+        'import time:        10 |         45 | infrastructure_accessibility',
+    ])
+    imports = parse_importtime(output)
+    assert imports == [('infrastructure_accessibility.provider', 35), ('infrastructure_accessibility', 10)]
+    assert deferred_imports(imports + [('numpy.core', 1), ('numpyro', 1)]) == ['numpy.core']
+
+
+def test_provider_registers_algorithms(startup):
+    _, _, algorithms = startup
+    assert len(algorithms) == 5
+    assert all(algorithm.startswith('infrastructureaccessibility:') for algorithm in algorithms)
+
+
+def test_startup_defers_compute_backends(startup):
+    imports, _, _ = startup
+    assert deferred_imports(imports) == []
+
+
+def test_startup_within_budget(startup):
+    imports, total_ms, _ = startup
+    slowest = sorted(imports, key=lambda item: -item[1])[:10]
+    assert total_ms <= STARTUP_BUDGET_MS, 'startup imports take {:.1f} ms, slowest:\n{}'.format(
+        total_ms, '\n'.join('  {:>8.1f} ms  {}'.format(time / 1000.0, module) for module, time in slowest))
@@ -0,0 +1,96 @@
+"""
+Tests of the multi-temporal scoring and its snapshot reuse.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+shapely = pytest.importorskip('shapely', minversion='2.0')
+
+from shapely.geometry import LineString, Point  # noqa: E402
+
+from infrastructure_accessibility import engine, temporal  # noqa: E402
+from infrastructure_accessibility.scoring import band_score, combined_score  # noqa: E402
+
+ROAD_DISTANCE = 100
+MARKET_DISTANCE = 200
+ROAD_WEIGHT = 0.6
+
+
+def _wkb(geometries):
+    return [None if geometry is None else shapely.to_wkb(geometry) for geometry in geometries]
+
+
+def _expected(coops, roads, markets):
+    return np.array([
+        combined_score(
+            band_score(min((coop.distance(road) for road in roads), default=None), ROAD_DISTANCE),
+            band_score(min((coop.distance(market) for market in markets), default=None), MARKET_DISTANCE),
+            ROAD_WEIGHT
+        )
+        for coop in coops
+    ])
+
+
+def test_fingerprint_ignores_order_and_missing_geometries():
+    wkb = _wkb([Point(0, 0), LineString([(0, 0), (1, 1)]), Point(5, 5)])
+    assert temporal.fingerprint(wkb) == temporal.fingerprint(list(reversed(wkb)))
+    assert temporal.fingerprint(wkb) == temporal.fingerprint([None] + wkb + [None])
+    assert temporal.fingerprint(wkb) != temporal.fingerprint(wkb[:2])
+    assert temporal.fingerprint(wkb) != temporal.fingerprint(_wkb([Point(0, 0), Point(5, 5), Point(5, 6)]))
+    assert temporal.fingerprint([]) == temporal.fingerprint([None])
+
+
+def test_unchanged_snapshots_are_reused(monkeypatch):
+    indexed = []
+
+    class CountingIndex(engine.DistanceIndex):
+        def __init__(self, geometries):
+            indexed.append(len(geometries))
+            super().__init__(geometries)
+
+    monkeypatch.setattr(temporal, 'DistanceIndex', CountingIndex)
+
+    coops = [Point(0, 0), Point(150, 0), Point(400, 300), Point(1000, 1000)]
+    roads_2013 = [LineString([(0, 50), (500, 50)])]
+    roads_2015 = roads_2013 + [LineString([(900, 0), (900, 2000)])]
+    markets = [Point(0, 150), Point(400, 400)]
+    snapshots = [
+        (roads_2013, markets),
+        # Same markets as before, listed in another order
+        (roads_2015, list(reversed(markets))),
+        # Roads back to the first snapshot, in another order with a null
+        (list(reversed(roads_2013)) + [None], markets),
+    ]
+
+    scorer = temporal.TemporalScorer(
+        shapely.from_wkb(np.array(_wkb(coops), dtype=object)), ROAD_DISTANCE, MARKET_DISTANCE, ROAD_WEIGHT)
+    scores = []
+    reuse = []
+    for roads, snapshot_markets in snapshots:
+        snapshot_scores, roads_reused, markets_reused = scorer.score(_wkb(roads), _wkb(snapshot_markets))
+        np.testing.assert_allclose(snapshot_scores, _expected(coops, [r for r in roads if r], snapshot_markets))
+        scores.append(snapshot_scores)
+        reuse.append((roads_reused, markets_reused))
+
+    assert reuse == [(False, False), (False, True), (True, True)]
+    # Two road snapshots and one market snapshot were indexed
+    assert len(indexed) == 3
+
+    deltas = temporal.score_deltas(scores)
+    assert len(deltas) == 2
+    np.testing.assert_allclose(deltas[0], scores[1] - scores[0])
+    np.testing.assert_allclose(deltas[1], scores[2] - scores[1])
+    # The road added in 2015 only changes the score of the last cooperative
+    np.testing.assert_allclose(deltas[0][:3], 0)
+    assert deltas[0][3] == pytest.approx(ROAD_WEIGHT * band_score(100, ROAD_DISTANCE))
+    np.testing.assert_allclose(deltas[1], -deltas[0])
+
+
+def test_empty_snapshot_scores_zero():
+    coops = [Point(0, 0), None]
+    scorer = temporal.TemporalScorer(
+        shapely.from_wkb(np.array(_wkb(coops), dtype=object)), ROAD_DISTANCE, MARKET_DISTANCE, ROAD_WEIGHT)
+    scores, _, _ = scorer.score([], [None])
+    np.testing.assert_allclose(scores, [0, 0])
+    assert temporal.score_deltas([scores]) == []
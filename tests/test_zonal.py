@@ -0,0 +1,84 @@
+"""
+Tests of the mergeable zone score statistics against NumPy.
+"""
+
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from infrastructure_accessibility.zonal import ZONE_PERCENTILES, ScoreAccumulator  # noqa: E402
+
+# Scores the ring bands produce, and two arbitrary ones
+SCORES = (0.0, 50.0, 80.0, 90.0, 54.0, 66.0, 73.5, 97.25)
+
+
+def _scores(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(SCORES) for _ in range(count)]
+
+
+def _accumulate(scores):
+    accumulator = ScoreAccumulator()
+    for score in scores:
+        accumulator.add(score)
+    return accumulator
+
+
+def _check(accumulator, scores):
+    assert accumulator.count == len(scores)
+    assert accumulator.mean == pytest.approx(np.mean(scores))
+    assert accumulator.std() == pytest.approx(np.std(scores))
+    assert accumulator.minimum == min(scores)
+    assert accumulator.maximum == max(scores)
+    for q in ZONE_PERCENTILES + (0, 25, 75, 100):
+        assert accumulator.percentile(q) == pytest.approx(np.percentile(scores, q)), q
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 10, 101, 1000])
+def test_statistics_match_numpy(count):
+    scores = _scores(count, seed=count)
+    _check(_accumulate(scores), scores)
+
+
+def test_empty_accumulator():
+    accumulator = ScoreAccumulator()
+    assert accumulator.count == 0
+    assert accumulator.std() is None
+    assert accumulator.percentile(50) is None
+
+
+@pytest.mark.parametrize('chunks', [2, 3, 7])
+def test_merged_chunks_match_whole(chunks):
+    scores = _scores(500, seed=chunks)
+    bounds = sorted(random.Random(chunks).sample(range(1, len(scores)), chunks - 1))
+    parts = [scores[start:end] for start, end in zip([0] + bounds, bounds + [len(scores)])]
+
+    merged = ScoreAccumulator()
+    for part in parts:
+        merged.merge(_accumulate(part))
+    _check(merged, scores)
+
+    # Merging in a tree instead of sequentially gives the same result
+    left = _accumulate(parts[0])
+    right = ScoreAccumulator()
+    for part in parts[1:]:
+        right.merge(_accumulate(part))
+    left.merge(right)
+    _check(left, scores)
+
+
+def test_merge_with_empty_accumulators():
+    scores = _scores(20)
+    accumulator = ScoreAccumulator()
+    accumulator.merge(_accumulate(scores))
+    accumulator.merge(ScoreAccumulator())
+    _check(accumulator, scores)
+
+    # The merged histogram is a copy, adding to one does not change the other
+    source = _accumulate(scores)
+    copy = ScoreAccumulator()
+    copy.merge(source)
+    copy.add(100.0)
+    _check(source, scores)